@@ -1,23 +1,51 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core import security, database
 from app.models import user as user_model
 from app.schemas import token as token_schema
 from app.core.config import settings
+from app.services.login_limiter import login_limiter, LoginThrottled
 
 router = APIRouter()
 
 @router.post("/login/access-token", response_model=token_schema.Token)
-def login_access_token(db: Session = Depends(database.get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = db.query(user_model.User).filter(user_model.User.username == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_access_token(
+    request: Request,
+    db: AsyncSession = Depends(database.get_db),
+    form_data: OAuth2PasswordRequestForm = Depends(),
+):
+    client_ip = request.client.host if request.client else "unknown"
+    try:
+        with login_limiter.attempt(form_data.username, client_ip):
+            result = await db.execute(select(user_model.User).where(user_model.User.username == form_data.username))
+            user = result.scalars().first()
+            valid, new_hash = False, None
+            if user:
+                # bcrypt runs in the hashing process pool, off the event loop
+                valid, new_hash = await security.verify_and_update_password_async(
+                    form_data.password, user.hashed_password
+                )
+            if not valid:
+                login_limiter.record_failure(form_data.username, client_ip)
+    except LoginThrottled as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Cost parameters changed since this hash was made: store the new one
+        user.hashed_password = new_hash
+        await db.commit()
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     
@@ -1,21 +1,33 @@
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
-from app.core import security, config, database
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.core import config
+from app.core.database import get_db
 from app.models import user as user_model
 from app.schemas import token as token_schema
+from app.services.cache import principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{config.settings.API_V1_STR}/auth/login/access-token")
 
-def get_db():
-    try:
-        db = database.SessionLocal()
-        yield db
-    finally:
-        db.close()
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as seen by request handlers. Cached per token
+    subject, so it carries the owned VMs ((cluster, vmid) -> node) for
+    ownership checks.
+    """
+    id: int
+    username: str
+    is_active: bool
+    is_superuser: bool
+    vms: Dict[Tuple[str, int], str] = field(default_factory=dict)
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_user_from_token(db: AsyncSession, token: str) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -30,17 +42,43 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     except JWTError:
         raise credentials_exception
         
-    user = db.query(user_model.User).filter(user_model.User.username == token_data.username).first()
-    if user is None:
-        raise credentials_exception
+    principal = principal_cache.get(token_data.username)
+    if principal is None:
+        result = await db.execute(
+            select(user_model.User)
+            .options(selectinload(user_model.User.vms))
+            .where(user_model.User.username == token_data.username)
+        )
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal(
+            id=user.id,
+            username=user.username,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+            vms={(vm.cluster, vm.vmid): vm.node for vm in user.vms},
+        )
+        principal_cache.set(token_data.username, principal)
+    return principal
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    # On a principal cache hit the session never checks out a connection
+    return await get_user_from_token(db, token)
+
+async def get_current_user_from_query(token: str, db: AsyncSession = Depends(get_db)):
+    # For EventSource / WebSocket clients that cannot send an Authorization header
+    user = await get_user_from_token(db, token)
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
-def get_current_active_user(current_user: user_model.User = Depends(get_current_user)):
+def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_active_superuser(current_user: user_model.User = Depends(get_current_user)):
+def get_current_active_superuser(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_superuser:
         raise HTTPException(status_code=400, detail="The user doesn't have enough privileges")
     return current_user
@@ -0,0 +1,119 @@
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.api import deps
+from app.core import database
+from app.core.config import settings
+from app.core.profiling import trace_buffer
+from app.services.cache import vm_config_cache, principal_cache
+from app.services.clusters import pve_clusters
+from app.services.inventory import cluster_state
+from app.services.placement import STRATEGIES, placement_scheduler
+from app.services.vnc_relay import relay_summary
+from app.services.vnc_connect import console_parking
+
+router = APIRouter()
+
+@router.get("/cache", response_model=Dict[str, Any])
+def get_cache_stats(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Hit/miss counters of the in-process PVE caches.
+    """
+    return {
+        "vm_config": vm_config_cache.stats(),
+        "guest_ip": {cluster.name: cluster.api.ip_resolver.cache.stats() for cluster in pve_clusters},
+        "principal": principal_cache.stats(),
+        "last_known_good": {cluster.name: cluster.api.last_good.stats() for cluster in pve_clusters},
+    }
+
+@router.get("/clusters", response_model=Dict[str, Any])
+def get_clusters(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Configured PVE clusters and the state of their last inventory refresh.
+    """
+    clusters = []
+    for cluster in pve_clusters:
+        state = cluster_state.clusters.get(cluster.name, {})
+        clusters.append({
+            "name": cluster.name,
+            "host": cluster.config.host,
+            "port": cluster.config.port,
+            "nodes": len(state.get("nodes", [])),
+            "vms": len(state.get("vms", [])),
+            "updated_at": state.get("updated_at"),
+            "error": state.get("error"),
+            "stale_since": state.get("stale_since"),
+            "circuit": cluster.breaker.as_dict() if cluster.breaker else None,
+            "endpoints": cluster.endpoints.snapshot() if cluster.endpoints else None,
+        })
+    return {"default": pve_clusters.default, "clusters": clusters}
+
+@router.get("/placement", response_model=Dict[str, Any])
+async def get_placement(
+    cluster: Optional[str] = None,
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Node loads the clone placement strategies work from, including clones
+    placed but not in the inventory yet, and the node each would pick next.
+    """
+    try:
+        pve_cluster = pve_clusters.get(cluster)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    loads, demand = await placement_scheduler.node_loads(pve_cluster)
+    return {
+        "cluster": pve_cluster.name,
+        "strategy": settings.PVE_PLACEMENT_STRATEGY,
+        "nodes": [load.as_dict() for load in loads],
+        "next": {name: choose(loads, demand).name if loads else None for name, choose in STRATEGIES.items()},
+    }
+
+@router.get("/vnc-sessions", response_model=Dict[str, Any])
+def get_vnc_sessions(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Active VNC relay sessions with per-direction throughput and frame latency,
+    plus upstream sockets opened by /vnc-connect and not yet claimed.
+    """
+    summary = relay_summary()
+    summary["parked_connections"] = len(console_parking)
+    return summary
+
+@router.get("/db", response_model=Dict[str, Any])
+def get_db_stats(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Engine profile and connection pool usage.
+    """
+    return database.pool_status()
+
+@router.get("/traces", response_model=Dict[str, Any])
+def get_traces(
+    sort: str = Query("duration", pattern="^(duration|recent)$"),
+    limit: int = Query(20, ge=1, le=1000),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Span trees (handler, PVE calls, SQL statements) of profiled requests,
+    slowest or most recent first. Empty unless PROFILING_ENABLED is set.
+    """
+    return {
+        "enabled": settings.PROFILING_ENABLED,
+        "slow_ms": settings.PROFILING_SLOW_MS,
+        "sample_rate": settings.PROFILING_SAMPLE_RATE,
+        "buffered": len(trace_buffer),
+        "traces": trace_buffer.list(sort, limit),
+    }
+
+@router.delete("/traces")
+def clear_traces(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    trace_buffer.clear()
+    return {"status": "cleared"}
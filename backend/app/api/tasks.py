@@ -0,0 +1,85 @@
+import asyncio
+import json
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.models import task as task_model
+from app.schemas import task as task_schema
+from app.services.tasks import task_tracker
+
+router = APIRouter()
+
+def _visible_tasks(current_user: deps.Principal):
+    query = select(task_model.Task)
+    if not current_user.is_superuser:
+        owned = list(current_user.vms)
+        query = query.where(or_(
+            task_model.Task.user_id == current_user.id,
+            tuple_(task_model.Task.cluster, task_model.Task.vmid).in_(owned),
+        ))
+    return query
+
+@router.get("/", response_model=List[task_schema.Task])
+async def list_tasks(
+    db: AsyncSession = Depends(deps.get_db),
+    active_only: bool = False,
+    limit: int = 100,
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
+):
+    """
+    Recent PVE tasks started through this system.
+    """
+    query = _visible_tasks(current_user)
+    if active_only:
+        query = query.where(task_model.Task.status == "running")
+    result = await db.execute(query.order_by(task_model.Task.id.desc()).limit(limit))
+    return result.scalars().all()
+
+@router.get("/stream")
+async def stream_tasks(
+    request: Request,
+    current_user: deps.Principal = Depends(deps.get_current_user_from_query),
+):
+    """
+    Server-sent events: one 'task' event whenever a visible task is created or finishes.
+    Authenticate with ?token=<access token> (EventSource cannot send headers).
+    """
+    is_superuser = current_user.is_superuser
+    user_id = current_user.id
+    owned = set(current_user.vms)
+    queue = task_tracker.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if (
+                    not is_superuser
+                    and event.get('user_id') != user_id
+                    and (event.get('cluster'), event.get('vmid')) not in owned
+                ):
+                    continue
+                yield f"event: task\ndata: {json.dumps(event)}\n\n"
+        finally:
+            task_tracker.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/{upid}", response_model=task_schema.Task)
+async def read_task(
+    upid: str,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
+):
+    result = await db.execute(_visible_tasks(current_user).where(task_model.Task.upid == upid))
+    task = result.scalars().first()
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
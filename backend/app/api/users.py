@@ -1,63 +1,75 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.api import deps
 from app.models import user as user_model
 from app.schemas import user as user_schema
 from app.core import security
+from app.services.cache import principal_cache
 
 router = APIRouter()
 
 @router.get("/", response_model=List[user_schema.User])
-def read_users(
-    db: Session = Depends(deps.get_db),
+async def read_users(
+    db: AsyncSession = Depends(deps.get_db),
     skip: int = 0,
     limit: int = 100,
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
-    users = db.query(user_model.User).offset(skip).limit(limit).all()
-    return users
+    result = await db.execute(
+        select(user_model.User)
+        .options(selectinload(user_model.User.vms))
+        .order_by(user_model.User.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.scalars().all()
 
 @router.post("/", response_model=user_schema.User)
-def create_user(
+async def create_user(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     user_in: user_schema.UserCreate,
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
-    user = db.query(user_model.User).filter(user_model.User.username == user_in.username).first()
-    if user:
+    result = await db.execute(select(user_model.User).where(user_model.User.username == user_in.username))
+    if result.scalars().first():
         raise HTTPException(
             status_code=400,
             detail="The user with this username already exists in the system.",
         )
     user = user_model.User(
         username=user_in.username,
-        hashed_password=security.get_password_hash(user_in.password),
+        hashed_password=await security.get_password_hash_async(user_in.password),
+        vms=[],
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    principal_cache.invalidate(user.username)
     return user
 
 @router.delete("/{user_id}", response_model=user_schema.User)
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
-    user = db.query(user_model.User).filter(user_model.User.id == user_id).first()
+    user = await db.get(user_model.User, user_id, options=[selectinload(user_model.User.vms)])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.username == "admin":
          raise HTTPException(status_code=400, detail="Cannot delete default admin user")
          
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    principal_cache.invalidate(user.username)
     return user
 
 @router.get("/me", response_model=user_schema.User)
-def read_user_me(
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+async def read_user_me(
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
-    return current_user
+    return await db.get(user_model.User, current_user.id, options=[selectinload(user_model.User.vms)])
@@ -1,30 +1,76 @@
-from typing import List, Any, Dict
+from collections import Counter
+from typing import List, Any, Dict, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api import deps
-from app.models import user as user_model
 from app.models import vm as vm_model
 from app.schemas import vm as vm_schema
-from app.services.pve import pve_service
+from app.services.clusters import PVECluster, pve_clusters
+from app.services.inventory import cluster_state, inventory_poller
+from app.services.bulk import run_bulk_action
+from app.services.placement import PlacementError, placement_scheduler
+from app.services.provisioning import node_limit, release_when_done, start_batch_clone
+from app.services.vmid import vmid_allocator
+from app.services.tasks import task_tracker
+from app.services.vm_status import RELOAD, vm_key, vm_status_hub
+from app.services.cache import principal_cache
+from app.services.vnc_connect import vnc_ticket_pool, console_parking
+from app.services.vnc_relay import (
+    VNCRelay, VNCSessionOptions, StarletteEndpoint, WebsocketsEndpoint, connect_pve_console,
+)
 from app.core.config import settings
-import websockets
-import ssl
+from app.core.resilience import PVEUnavailable
+from app.core import database, metrics, security
+from jose import JWTError
 import asyncio
-import urllib.parse
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def _get_cluster(name: Optional[str] = None) -> PVECluster:
+    try:
+        return pve_clusters.get(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+async def _place_clones(
+    cluster: PVECluster, template_node: str, template_vmid: int, new_vmids: List[int],
+    full: bool = False, strategy: Optional[str] = None,
+) -> List[str]:
+    """
+    Target node of each new clone from the placement scheduler. The VMIDs
+    are released if placement fails.
+    """
+    try:
+        return await placement_scheduler.place(
+            cluster, template_node, template_vmid, new_vmids, full=full, strategy=strategy
+        )
+    except Exception as e:
+        vmid_allocator.release(cluster.name, new_vmids)
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, PlacementError):
+            raise HTTPException(status_code=409, detail=str(e))
+        if isinstance(e, PVEUnavailable):
+            raise  # 503 with Retry-After (app.main)
+        # Reading the template from PVE failed
+        raise HTTPException(status_code=500, detail=f"PVE Clone failed: {str(e)}")
+
 # --- Admin Operations ---
 
 @router.get("/dashboard", response_model=Dict[str, Any])
-def get_dashboard_stats(
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+async def get_dashboard_stats(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
     """
     Get PVE Cluster Status for Dashboard.
     """
     try:
-        nodes = pve_service.get_nodes()
+        nodes = (await cluster_state.aget()).nodes
         # Filter online nodes
         online_nodes = [n for n in nodes if n.get('status') == 'online']
         
@@ -40,7 +86,10 @@ def get_dashboard_stats(
             total_mem += node.get('maxmem', 0)
             used_mem += node.get('mem', 0)
 
+        vms = [vm for vm in cluster_state.vms if not vm.get('template')]
         return {
+            "vms_count": len(vms),
+            "running_vms": len([vm for vm in vms if vm.get('status') == 'running']),
             "nodes_count": len(nodes),
             "online_nodes": len(online_nodes),
             "total_cpu": total_cpu,
@@ -53,94 +102,169 @@ def get_dashboard_stats(
         raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard data: {str(e)}")
 
 @router.get("/templates", response_model=List[Any])
-def list_templates(
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+async def list_templates(
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
     """
     Get all VMs that are templates.
     """
-    vms = pve_service.get_vms()
-    templates = [vm for vm in vms if vm.get('template') == 1]
-    return templates
+    return (await cluster_state.aget()).templates
 
 @router.post("/clone", response_model=vm_schema.VM)
-def clone_vm(
+async def clone_vm(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     vm_in: vm_schema.VMCreate,
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
     """
     Clone a VM and assign to user.
     """
-    # 1. Get next VMID
-    new_vmid = int(pve_service.get_next_vmid())
-    
-    # 2. Clone in PVE
+    cluster = _get_cluster(vm_in.cluster)
+    # 1. Reserve the next VMID (plain nextid races with concurrent clones)
+    taken = (await db.scalars(select(vm_model.VM.vmid).where(vm_model.VM.cluster == cluster.name))).all()
+    new_vmid = (await vmid_allocator.allocate(cluster.name, 1, exclude=taken))[0]
+
+    # 2. Pick the node to clone to
+    target = vm_in.target_node or (await _place_clones(
+        cluster, vm_in.node, vm_in.vmid, [new_vmid], strategy=vm_in.strategy
+    ))[0]
+
+    # 3. Clone in PVE, within the target node's clone slots (shared with batches)
+    slot = node_limit(cluster.name, target)
+    await slot.acquire()
     try:
-        pve_service.clone_vm(
+        upid = await cluster.api.clone_vm(
             node=vm_in.node,
             vmid=vm_in.vmid,
             newid=new_vmid,
-            name=vm_in.name
+            name=vm_in.name,
+            target_node=target if target != vm_in.node else None,
         )
     except Exception as e:
+        slot.release()
+        vmid_allocator.release(cluster.name, [new_vmid])
+        placement_scheduler.release(cluster.name, [new_vmid])
         raise HTTPException(status_code=500, detail=f"PVE Clone failed: {str(e)}")
+    try:
+        await task_tracker.register(upid, cluster.name, vmid=new_vmid, user_id=current_user.id, db=db)
+    finally:
+        release_when_done(slot, upid)
 
-    # 3. Create Record in DB
+    # 4. Create Record in DB
     db_vm = vm_model.VM(
+        cluster=cluster.name,
         vmid=new_vmid,
-        node=vm_in.node,
+        node=target,
         name=vm_in.name,
         owner_id=vm_in.owner_id
     )
     db.add(db_vm)
-    db.commit()
-    db.refresh(db_vm)
+    await db.commit()
+    principal_cache.clear()
+    vm_status_hub.reload_owners()
+    inventory_poller.trigger()
     return db_vm
 
+@router.post("/clone/batch", response_model=List[vm_schema.VM])
+async def batch_clone_vms(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    batch_in: vm_schema.VMBatchCreate,
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
+):
+    """
+    Provision one clone of a template per owner.
+    VMIDs are reserved up front and the VM records inserted in one go; the
+    clones then run in the background, limited per target node.
+    """
+    if not batch_in.owner_ids:
+        return []
+    cluster = _get_cluster(batch_in.cluster)
+
+    taken = (await db.scalars(select(vm_model.VM.vmid).where(vm_model.VM.cluster == cluster.name))).all()
+    try:
+        new_vmids = await vmid_allocator.allocate(cluster.name, len(batch_in.owner_ids), exclude=taken)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"VMID allocation failed: {str(e)}")
+
+    if batch_in.target_nodes:
+        targets = [batch_in.target_nodes[i % len(batch_in.target_nodes)] for i in range(len(new_vmids))]
+    else:
+        targets = await _place_clones(
+            cluster, batch_in.node, batch_in.vmid, new_vmids, full=batch_in.full, strategy=batch_in.strategy
+        )
+
+    db_vms = [
+        vm_model.VM(
+            cluster=cluster.name,
+            vmid=vmid,
+            node=targets[i],
+            name=f"{batch_in.name_prefix}-{i + 1}",
+            owner_id=owner_id
+        )
+        for i, (vmid, owner_id) in enumerate(zip(new_vmids, batch_in.owner_ids))
+    ]
+    clones = [{"vmid": vm.vmid, "name": vm.name, "node": vm.node} for vm in db_vms]
+    db.add_all(db_vms)
+    await db.commit()
+    principal_cache.clear()
+    vm_status_hub.reload_owners()
+
+    start_batch_clone(
+        cluster.name, batch_in.node, batch_in.vmid, clones, full=batch_in.full, user_id=current_user.id
+    )
+    return db_vms
+
 @router.post("/import", response_model=vm_schema.VM)
-def import_vm(
+async def import_vm(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     vm_in: vm_schema.VMImport,
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
     """
     Import an existing PVE VM into the database and assign to user.
     """
+    cluster = _get_cluster(vm_in.cluster)
     # Check if already exists
-    existing = db.query(vm_model.VM).filter(vm_model.VM.vmid == vm_in.vmid).first()
+    existing = (await db.scalars(
+        select(vm_model.VM).where(vm_model.VM.cluster == cluster.name, vm_model.VM.vmid == vm_in.vmid)
+    )).first()
     if existing:
          raise HTTPException(status_code=400, detail="VM already managed in system")
 
     db_vm = vm_model.VM(
+        cluster=cluster.name,
         vmid=vm_in.vmid,
         node=vm_in.node,
         name=vm_in.name,
         owner_id=vm_in.owner_id
     )
     db.add(db_vm)
-    db.commit()
-    db.refresh(db_vm)
+    await db.commit()
+    principal_cache.clear()
+    vm_status_hub.reload_owners()
     return db_vm
 
 @router.delete("/{vmid}")
-def delete_vm_entry(
+async def delete_vm_entry(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_superuser),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_superuser),
 ):
     """
     Delete VM from DB and PVE
     """
     # 1. Find in DB
-    vm_db = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
+    vm_db = await _find_managed_vm(db, vmid, cluster)
     
     # 2. Delete in PVE
     try:
         if vm_db:
-             pve_service.delete_vm(vm_db.node, vmid)
+             upid = await _get_cluster(vm_db.cluster).api.delete_vm(vm_db.node, vmid)
+             await task_tracker.register(upid, vm_db.cluster, vmid=vmid, user_id=current_user.id, db=db)
         else:
              # If we don't have DB record, we can't easily delete from PVE without knowing the node.
              # In a real scenario, we might want to pass 'node' as query param to allow deleting orphan PVE VMs.
@@ -150,16 +274,67 @@ def delete_vm_entry(
         pass
 
     if vm_db:
-        db.delete(vm_db)
-        db.commit()
+        await db.delete(vm_db)
+        await db.commit()
+        principal_cache.clear()
+        vm_status_hub.reload_owners()
+    inventory_poller.trigger()
     
     return {"status": "deleted"}
 
 
+def _build_vm_detail(cluster: str, vmid: int, db_vm=None, pve_vm=None) -> vm_schema.VMDetail:
+    """
+    Merge a DB record and/or a PVE inventory entry into a VMDetail.
+    """
+    if pve_vm is None:
+        # Missing: In DB but not found in PVE
+        return vm_schema.VMDetail(
+            id=db_vm.id,
+            cluster=cluster,
+            vmid=vmid,
+            node=db_vm.node,
+            name=db_vm.name,
+            owner_id=db_vm.owner_id,
+            status='unknown',
+            cpu=0,
+            maxmem=0,
+            uptime=0,
+            template=False,
+            ip=None,
+            sync_status='missing'
+        )
+
+    if db_vm is not None:
+        # Normal: Synced
+        node = db_vm.node
+        name = pve_vm.get('name') or db_vm.name
+    else:
+        # Orphan: In PVE but not managed
+        node = pve_vm.get('node', '')
+        name = pve_vm.get('name', '')
+
+    return vm_schema.VMDetail(
+        id=db_vm.id if db_vm is not None else None,
+        cluster=cluster,
+        vmid=vmid,
+        node=node,
+        name=name,
+        owner_id=db_vm.owner_id if db_vm is not None else None,
+        status=pve_vm.get('status', 'unknown'),
+        cpu=pve_vm.get('cpu', 0),
+        maxmem=pve_vm.get('maxmem', 0),
+        uptime=pve_vm.get('uptime', 0),
+        template=bool(pve_vm.get('template')),
+        os_type=pve_vm.get('ostype'),
+        ip=pve_vm.get('ip'),
+        sync_status='ok' if db_vm is not None else 'orphan'
+    )
+
 @router.get("/", response_model=List[vm_schema.VMDetail])
-def list_vms(
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+async def list_vms(
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
     """
     List VMs. 
@@ -167,176 +342,134 @@ def list_vms(
     - User: Sees only assigned DB VMs.
     """
     
-    # 1. Fetch PVE Data (Admin only usually, but let's do it for status sync)
-    # Optimization: Only fetch PVE list if admin. Regular users only need status for their VMs.
-    
-    pve_vms_map = {}
-    if current_user.is_superuser:
-        try:
-            pve_vms_list = pve_service.get_vms()
-            pve_vms_map = {int(vm.get('vmid')): vm for vm in pve_vms_list if str(vm.get('vmid')).isdigit()}
-        except Exception as e:
-            print(f"Error fetching PVE VMs: {e}")
+    # 1. Fetch DB Data
+    query = select(vm_model.VM)
+    if not current_user.is_superuser:
+        query = query.where(vm_model.VM.owner_id == current_user.id)
+    db_vms = (await db.scalars(query)).all()
 
-    # 2. Fetch DB Data
-    if current_user.is_superuser:
-        db_vms = db.query(vm_model.VM).all()
-    else:
-        db_vms = current_user.vms
+    # VMIDs are only unique within a cluster
+    db_vms_map = {(vm.cluster, vm.vmid): vm for vm in db_vms}
 
-    db_vms_map = {vm.vmid: vm for vm in db_vms}
+    # 2. Fetch PVE Data from the shared cluster state kept by the inventory poller
+    pve_vms_map = {}
+    try:
+        pve_vms_list = (await cluster_state.aget()).vms
+        pve_vms_map = {
+            (vm.get('cluster'), int(vm.get('vmid'))): vm
+            for vm in pve_vms_list if str(vm.get('vmid')).isdigit()
+        }
+    except Exception as e:
+        metrics.errors.inc(component="list_vms")
+        logger.warning("Error fetching PVE VMs: %s", e)
     
     results = []
 
     # If Admin: Show Union
     if current_user.is_superuser:
-        all_vmids = set(pve_vms_map.keys()) | set(db_vms_map.keys())
-        
-        for vmid in all_vmids:
-            in_pve = vmid in pve_vms_map
-            in_db = vmid in db_vms_map
-            
-            vm_detail = None
-            
-            if in_pve and in_db:
-                # Normal: Synced
-                pve_info = pve_vms_map[vmid]
-                db_info = db_vms_map[vmid]
-                template_flag = bool(pve_info.get('template'))
-                os_type = None
-                try:
-                    os_type = pve_service.get_vm_ostype(db_info.node, vmid)
-                except Exception:
-                    os_type = None
-                ip_addr = None
-                if pve_info.get('status') == 'running':
-                    try:
-                        ip_addr = pve_service.get_vm_ip(db_info.node, vmid)
-                    except Exception:
-                        ip_addr = None
-                vm_detail = vm_schema.VMDetail(
-                    id=db_info.id,
-                    vmid=vmid,
-                    node=db_info.node,
-                    name=pve_info.get('name') or db_info.name, 
-                    owner_id=db_info.owner_id,
-                    status=pve_info.get('status', 'unknown'),
-                    cpu=pve_info.get('cpu', 0),
-                    maxmem=pve_info.get('maxmem', 0),
-                    uptime=pve_info.get('uptime', 0),
-                    template=template_flag,
-                    os_type=os_type,
-                    ip=ip_addr,
-                    sync_status='ok'
-                )
-            elif in_pve and not in_db:
-                # Orphan: In PVE but not managed
-                pve_info = pve_vms_map[vmid]
-                # Filter out templates from the main list if desired, but user asked for all VMs.
-                # Usually templates are hidden from "Running VMs" list, but let's include them with status.
-                template_flag = bool(pve_info.get('template'))
-                os_type = None
-                try:
-                    os_type = pve_service.get_vm_ostype(pve_info.get('node', ''), vmid)
-                except Exception:
-                    os_type = None
-                ip_addr = None
-                if pve_info.get('status') == 'running':
-                    try:
-                        ip_addr = pve_service.get_vm_ip(pve_info.get('node', ''), vmid)
-                    except Exception:
-                        ip_addr = None
-                vm_detail = vm_schema.VMDetail(
-                    id=None, # No DB ID
-                    vmid=vmid,
-                    node=pve_info.get('node', ''),
-                    name=pve_info.get('name', ''),
-                    owner_id=None,
-                    status=pve_info.get('status', 'unknown'),
-                    cpu=pve_info.get('cpu', 0),
-                    maxmem=pve_info.get('maxmem', 0),
-                    uptime=pve_info.get('uptime', 0),
-                    template=template_flag,
-                    os_type=os_type,
-                    ip=ip_addr,
-                    sync_status='orphan'
-                )
-            elif in_db and not in_pve:
-                # Missing: In DB but not found in PVE
-                db_info = db_vms_map[vmid]
-                vm_detail = vm_schema.VMDetail(
-                    id=db_info.id,
-                    vmid=vmid,
-                    node=db_info.node,
-                    name=db_info.name,
-                    owner_id=db_info.owner_id,
-                    status='unknown',
-                    cpu=0,
-                    maxmem=0,
-                    uptime=0,
-                    template=False,
-                    ip=None,
-                    sync_status='missing'
-                )
-            
-            if vm_detail:
-                results.append(vm_detail)
-
+        all_keys = set(pve_vms_map.keys()) | set(db_vms_map.keys())
+        for key in all_keys:
+            results.append(_build_vm_detail(*key, db_vms_map.get(key), pve_vms_map.get(key)))
     else:
-        # Regular User: Just their DB VMs, but enrich with PVE status individually (or bulk if optimized)
-        # For simplicity, we iterate and fetch status individually as before, 
-        # OR we could reuse the bulk fetch if we assume the list is small.
-        # Let's keep original logic for users but safer.
+        # Regular User: Just their DB VMs, enriched from the same snapshot
         for vm_db in db_vms:
-            try:
-                # Skip templates for user portal
-                if pve_service.is_vm_template(vm_db.node, vm_db.vmid):
-                    continue
-                status = pve_service.get_vm_status(vm_db.node, vm_db.vmid)
-                os_type = pve_service.get_vm_ostype(vm_db.node, vm_db.vmid)
-                vm_detail = vm_schema.VMDetail(
-                    id=vm_db.id,
-                    vmid=vm_db.vmid,
-                    node=vm_db.node,
-                    name=vm_db.name,
-                    owner_id=vm_db.owner_id,
-                    status=status.get('status', 'unknown'),
-                    cpu=status.get('cpu', 0),
-                    maxmem=status.get('maxmem', 0),
-                    uptime=status.get('uptime', 0),
-                    template=False,
-                    os_type=os_type,
-                    ip=None,
-                    sync_status='ok'
-                )
-                results.append(vm_detail)
-            except Exception:
-                # Missing in PVE
-                vm_detail = vm_schema.VMDetail(
-                    id=vm_db.id,
-                    vmid=vm_db.vmid,
-                    node=vm_db.node,
-                    name=vm_db.name,
-                    owner_id=vm_db.owner_id,
-                    status='unknown',
-                    cpu=0,
-                    maxmem=0,
-                    uptime=0,
-                    template=False,
-                    ip=None,
-                    sync_status='missing'
-                )
-                results.append(vm_detail)
+            pve_vm = pve_vms_map.get((vm_db.cluster, vm_db.vmid))
+            # Skip templates for user portal
+            if pve_vm is not None and pve_vm.get('template'):
+                continue
+            results.append(_build_vm_detail(vm_db.cluster, vm_db.vmid, vm_db, pve_vm))
 
     return results
 
 # --- VM Actions ---
 
+async def _find_managed_vm(db: AsyncSession, vmid: int, cluster: Optional[str] = None):
+    """
+    The VM record for `vmid` in `cluster`, or in whichever cluster has it
+    when no cluster is given. None if not managed.
+    """
+    query = select(vm_model.VM).where(vm_model.VM.vmid == vmid)
+    if cluster:
+        query = query.where(vm_model.VM.cluster == cluster)
+    vms = (await db.scalars(query.limit(2))).all()
+    if len(vms) > 1:
+        raise HTTPException(status_code=409, detail="VMID is managed in several clusters, pass ?cluster=")
+    return vms[0] if vms else None
+
+async def _get_managed_vm(
+    db: AsyncSession, vmid: int, current_user: deps.Principal, cluster: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    (cluster, node) of a managed VM the user may act on. VMs owned by the
+    user are answered from the cached principal without a query.
+    """
+    owned = [
+        (vm_cluster, node) for (vm_cluster, vm_vmid), node in current_user.vms.items()
+        if vm_vmid == vmid and cluster in (None, vm_cluster)
+    ]
+    if len(owned) == 1:
+        return owned[0]
+    vm = await _find_managed_vm(db, vmid, cluster)
+    if not vm:
+        # Actions require management (DB record), we need the node.
+        raise HTTPException(status_code=404, detail="VM not found in management system")
+    if not current_user.is_superuser and vm.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return vm.cluster, vm.node
+
+@router.post("/bulk-action", response_model=List[vm_schema.VMActionResult])
+async def bulk_vm_action(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    bulk_in: vm_schema.VMBulkAction,
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
+):
+    """
+    Run start/stop/shutdown/reset on many managed VMs at once.
+    Returns one result (with the PVE UPID) per requested vmid.
+    """
+    cluster = _get_cluster(bulk_in.cluster).name
+    vmids = list(dict.fromkeys(bulk_in.vmids))
+    if not current_user.is_superuser and all((cluster, vmid) in current_user.vms for vmid in vmids):
+        # All owned: nodes come from the cached principal, no query needed
+        targets = {vmid: current_user.vms[(cluster, vmid)] for vmid in vmids}
+    else:
+        vms = (await db.scalars(
+            select(vm_model.VM).where(vm_model.VM.cluster == cluster, vm_model.VM.vmid.in_(vmids))
+        )).all()
+        if not current_user.is_superuser and any(vm.owner_id != current_user.id for vm in vms):
+            raise HTTPException(status_code=403, detail="Not authorized")
+        targets = {vm.vmid: vm.node for vm in vms}
+
+    results = [
+        vm_schema.VMActionResult(
+            cluster=cluster, vmid=vmid, status='not_found', detail="VM not found in management system"
+        )
+        for vmid in vmids if vmid not in targets
+    ]
+    dispatched = await run_bulk_action(
+        bulk_in.action, [(cluster, node, vmid) for vmid, node in targets.items()]
+    )
+    # A node-level startall UPID covers several VMs and is recorded without a vmid
+    upid_counts = Counter(r.get('upid') for r in dispatched)
+    await task_tracker.register_many(
+        [
+            (r.get('upid'), r['cluster'], r['vmid'] if upid_counts[r.get('upid')] == 1 else None)
+            for r in dispatched
+        ],
+        user_id=current_user.id,
+        db=db,
+    )
+    results.extend(vm_schema.VMActionResult(**r) for r in dispatched)
+    inventory_poller.trigger()
+    return results
+
 @router.post("/{vmid}/start")
-def start_vm(
+async def start_vm(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
     # Check permission. 
     # If admin and VM is orphan (no DB record), allow? 
@@ -344,151 +477,222 @@ def start_vm(
     # Let's enforce DB record for actions for now, OR allow admins to act on orphans if we pass node.
     # To keep it simple: Actions require management (DB record).
     
-    vm = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
-    if not vm:
-        # If admin, maybe we can find it in PVE?
-        # But we need the node.
-        # Let's stick to "Must be managed".
-        raise HTTPException(status_code=404, detail="VM not found in management system")
-        
-    if not current_user.is_superuser and vm.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    pve_service.start_vm(vm.node, vm.vmid)
-    return {"status": "started"}
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    upid = await _get_cluster(cluster).api.start_vm(node, vmid)
+    await task_tracker.register(upid, cluster, vmid=vmid, user_id=current_user.id, db=db)
+    inventory_poller.trigger()
+    return {"status": "started", "upid": upid}
 
 @router.post("/{vmid}/stop")
-def stop_vm(
+async def stop_vm(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
-    vm = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
-    if not current_user.is_superuser and vm.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    pve_service.stop_vm(vm.node, vm.vmid)
-    return {"status": "stopped"}
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    upid = await _get_cluster(cluster).api.stop_vm(node, vmid)
+    await task_tracker.register(upid, cluster, vmid=vmid, user_id=current_user.id, db=db)
+    inventory_poller.trigger()
+    return {"status": "stopped", "upid": upid}
 
 @router.post("/{vmid}/shutdown")
-def shutdown_vm(
+async def shutdown_vm(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
-    vm = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
-    if not current_user.is_superuser and vm.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    pve_service.shutdown_vm(vm.node, vm.vmid)
-    return {"status": "shutdown initiated"}
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    upid = await _get_cluster(cluster).api.shutdown_vm(node, vmid)
+    await task_tracker.register(upid, cluster, vmid=vmid, user_id=current_user.id, db=db)
+    inventory_poller.trigger()
+    return {"status": "shutdown initiated", "upid": upid}
 
 @router.post("/{vmid}/reset")
-def reset_vm(
+async def reset_vm(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
-    vm = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
-    if not current_user.is_superuser and vm.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    pve_service.reset_vm(vm.node, vm.vmid)
-    return {"status": "reset initiated"}
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    upid = await _get_cluster(cluster).api.reset_vm(node, vmid)
+    await task_tracker.register(upid, cluster, vmid=vmid, user_id=current_user.id, db=db)
+    inventory_poller.trigger()
+    return {"status": "reset initiated", "upid": upid}
 
 # --- VNC ---
 
 @router.get("/{vmid}/vnc-ticket")
-def get_vnc_ticket(
+async def get_vnc_ticket(
     vmid: int,
-    db: Session = Depends(deps.get_db),
-    current_user: user_model.User = Depends(deps.get_current_active_user),
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
 ):
-    vm = db.query(vm_model.VM).filter(vm_model.VM.vmid == vmid).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
-    if not current_user.is_superuser and vm.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    response = await vnc_ticket_pool.get(cluster, node, vmid)
+    # Signed connection token for the console WebSocket (API or gateway)
+    response['token'] = security.create_vnc_token(
+        current_user.id, cluster, node, vmid, response['port'], response['ticket'],
+        host=_get_cluster(cluster).console_host(node),
+    )
+    response['gateway_url'] = settings.VNC_GATEWAY_URL or None
+    return response
+
+@router.post("/{vmid}/vnc-prefetch")
+async def prefetch_vnc_ticket(
+    vmid: int,
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
+):
+    """
+    Hint that the user is about to open this console: fetch a ticket now.
+    """
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    vnc_ticket_pool.prefetch(cluster, node, vmid)
+    return {"status": "prefetching"}
 
-    response = pve_service.get_vnc_ticket(vm.node, vm.vmid)
+@router.post("/{vmid}/vnc-connect")
+async def connect_vnc(
+    vmid: int,
+    cluster: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: deps.Principal = Depends(deps.get_current_active_user),
+):
+    """
+    Console fast path: get a ticket and start opening the PVE socket in one
+    call. The browser then connects with ?connect=<key> and is attached to the
+    already open upstream. The signed token is returned as well: the key is
+    single use and only known to this process, so a socket that cannot claim
+    it (another worker, or the gateway) falls back to the token. Once the PVE
+    ticket itself is used up, the viewer gets a fresh one from /vnc-ticket.
+    """
+    cluster, node = await _get_managed_vm(db, vmid, current_user, cluster)
+    ticket = await vnc_ticket_pool.get(cluster, node, vmid)
+    response = {
+        "password": ticket.get('password'),
+        "gateway_url": settings.VNC_GATEWAY_URL or None,
+        "token": security.create_vnc_token(
+            current_user.id, cluster, node, vmid, ticket['port'], ticket['ticket'],
+            host=_get_cluster(cluster).console_host(node),
+        ),
+    }
+    if not settings.VNC_GATEWAY_URL:
+        # The gateway runs in other processes: the socket cannot be handed over
+        response['connect'] = console_parking.park(cluster, node, vmid, ticket)
     return response
 
 # WebSocket Proxy for VNC
-# Note: This is a standalone endpoint, not dependent on 'router' usually if using class based views, 
-# but in FastAPI we can just define it. However, WebSockets in routers can be tricky with path params.
-# I'll define it here but it might need to be mounted in main.py if prefixes are an issue.
-# The path will be /api/v1/vms/ws/vncproxy/{node}/{vmid}
-# But wait, the client connects to this. 
-# The ticket should be passed in query params.
-
-# SSL Context for PVE connection
-pve_ssl_context = ssl.create_default_context()
-if not settings.PVE_VERIFY_SSL:
-    pve_ssl_context.check_hostname = False
-    pve_ssl_context.verify_mode = ssl.CERT_NONE
+# The path will be /api/v1/vms/ws/vncproxy/{node}/{vmid}?token=... (or ?connect=...&token=...
+# for a socket opened by /vnc-connect)
+# (the standalone gateway in app.vnc_gateway serves the same path).
+# The legacy ?ticket=...&port=...[&cluster=...] form is still accepted.
 
 @router.websocket("/ws/vncproxy/{node}/{vmid}")
 async def vnc_proxy(
     websocket: WebSocket, 
     node: str, 
     vmid: int, 
-    ticket: str, 
-    port: str
+    ticket: str = None, 
+    port: str = None,
+    token: str = None,
+    connect: str = None,
+    cluster: str = None,
 ):
     # NOTE: WebSocket does not support 'Depends' for Auth easily in the handshake for all clients (browser limitation).
-    # Usually the ticket acts as auth. Here the 'ticket' param is the PVE ticket.
-    # We should ideally validate a JWT token here too, but standard noVNC client only supports one token param usually.
-    # For now, we rely on the fact that the user got the valid PVE ticket from our API (which required Auth).
-    
-    clean_ticket = urllib.parse.quote(ticket, safe='')
-    
-    headers = {
-        "Authorization": f"PVEAPIToken={settings.PVE_USER}!{settings.PVE_TOKEN_NAME}={settings.PVE_TOKEN_VALUE}",
-        "Origin": f"https://{settings.PVE_HOST}:{settings.PVE_PORT}",
-    }
-
-    pve_ws_url = (
-        f"wss://{settings.PVE_HOST}:{settings.PVE_PORT}/api2/json/nodes/{node}/qemu/{vmid}/vncwebsocket?"
-        f"port={port}&vncticket={clean_ticket}"
-    )
+    # The token from /vnc-ticket is signed and short-lived and names the VM it was issued for.
+    # A ?connect= key that cannot be claimed here falls back to the token
+    upstream = console_parking.take(connect, node, vmid) if connect else None
+    if upstream is None and token:
+        try:
+            claims = security.decode_vnc_token(token)
+        except JWTError:
+            claims = None
+        if claims is None or claims['node'] != node or claims['vmid'] != vmid:
+            await websocket.close(code=1008)
+            return
+        ticket, port, cluster = claims['ticket'], claims['port'], claims.get('cluster')
+    elif upstream is None and (connect or not ticket or not port):
+        await websocket.close(code=1008)
+        return
 
     pve_ws = None
     try:
-        pve_ws = await websockets.connect(
-            pve_ws_url,
-            ssl=pve_ssl_context,
-            subprotocols=['binary'],
-            additional_headers=headers
-        )
+        if upstream is not None:
+            pve_ws = await upstream
+        else:
+            pve_cluster = pve_clusters.get(cluster)
+            pve_ws = await connect_pve_console(
+                pve_cluster.config, node, vmid, port, ticket, host=pve_cluster.console_host(node)
+            )
 
         await websocket.accept()
-        
-        async def pve_to_client():
-            try:
-                async for message in pve_ws:
-                    await websocket.send_bytes(message if isinstance(message, bytes) else message.encode())
-            except:
-                pass
-
-        async def client_to_pve():
-            try:
-                while True:
-                    data = await websocket.receive_bytes()
-                    await pve_ws.send(data)
-            except:
-                pass
-
-        await asyncio.gather(pve_to_client(), client_to_pve())
+        # Bounded, backpressure-aware pump; closes both sides when done.
+        # ?compress=1 / ?coalesce=1 opt this session into the WAN options.
+        options = VNCSessionOptions.from_query(websocket.query_params)
+        relay = VNCRelay(
+            StarletteEndpoint(websocket), WebsocketsEndpoint(pve_ws), node=node, vmid=vmid, options=options
+        )
+        await relay.run()
 
     except Exception as e:
-        print(f"VNC Proxy Error: {e}")
-        await websocket.close()
+        logger.warning("VNC proxy error for VM %s on %s: %s", vmid, node, e)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
     finally:
         if pve_ws:
             await pve_ws.close()
+
+# --- Status push ---
+
+async def _owned_vm_keys(user_id: int) -> List[str]:
+    async with database.SessionLocal() as db:
+        result = await db.execute(
+            select(vm_model.VM.cluster, vm_model.VM.vmid).where(vm_model.VM.owner_id == user_id)
+        )
+        return [vm_key(cluster, vmid) for cluster, vmid in result.all()]
+
+@router.websocket("/ws/status")
+async def vm_status_socket(websocket: WebSocket, token: str):
+    """
+    Push VM state (status, uptime, ip, cpu, ...) from the shared inventory poll.
+    The first message is a snapshot of the VMs the user may see, then only diffs:
+    {"type": "diff", "changed": {"<cluster>/<vmid>": {field: value}}, "removed": ["<cluster>/<vmid>"]}
+    When the user's VMs change, a new snapshot of the new set follows.
+    """
+    try:
+        async with database.SessionLocal() as db:
+            user = await deps.get_user_from_token(db, token)
+        if not user.is_active:
+            user = None
+        else:
+            keys = None if user.is_superuser else [vm_key(*key) for key in user.vms]
+    except HTTPException:
+        user = None
+    if user is None:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscription = vm_status_hub.subscribe(keys)
+    try:
+        await websocket.send_json(vm_status_hub.snapshot(subscription))
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), timeout=30)
+            except asyncio.TimeoutError:
+                # Keep idle connections alive and notice dead ones
+                message = {"type": "ping"}
+            if message is RELOAD:
+                subscription.keys = set(await _owned_vm_keys(user.id))
+                message = vm_status_hub.snapshot(subscription)
+            await websocket.send_json(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        vm_status_hub.unsubscribe(subscription)
@@ -1,5 +1,24 @@
+from typing import List
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+
+class PVEClusterConfig(BaseModel):
+    """
+    One PVE cluster the portal manages (an entry of PVE_CLUSTERS).
+    """
+    name: str
+    host: str
+    port: int = 8006
+    user: str = "root@pam"
+    token_name: str = ""
+    token_value: str = ""
+    verify_ssl: bool = False
+    # Other members ("host" or "host:port") to reach the cluster through when
+    # `host` is down; more are discovered with PVE_ENDPOINT_POOL
+    hosts: List[str] = []
+
+
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "PVE VDI"
@@ -11,14 +30,137 @@ class Settings(BaseSettings):
     PVE_TOKEN_NAME: str = ""
     PVE_TOKEN_VALUE: str = ""
     PVE_VERIFY_SSL: bool = False
+    # Other members of the PVE_HOST cluster, as a JSON list of "host[:port]"
+    PVE_HOSTS: List[str] = []
+    # Name under which the PVE_HOST cluster above is known
+    PVE_CLUSTER_NAME: str = "default"
+    # Several clusters, as a JSON list of PVEClusterConfig objects, e.g.
+    # [{"name": "lab", "host": "10.0.0.1", "token_name": "vdi", "token_value": "..."}, ...]
+    # When set it replaces PVE_HOST/PVE_HOSTS/PVE_PORT/PVE_USER/PVE_TOKEN_*/PVE_VERIFY_SSL;
+    # the first cluster is the default one
+    PVE_CLUSTERS: List[PVEClusterConfig] = []
+    # Endpoint pool: send API calls to the healthy cluster node with the lowest
+    # latency (nodes from /cluster/status, probed every CHECK_INTERVAL seconds),
+    # retry GETs (and calls that could not connect) on up to RETRIES other
+    # nodes, and open consoles on the VM's own node
+    PVE_ENDPOINT_POOL: bool = False
+    PVE_ENDPOINT_CHECK_INTERVAL: int = 10
+    PVE_ENDPOINT_RETRIES: int = 2
+    # Circuit breaker per API endpoint: after BREAKER_FAILURES consecutive
+    # unreachable/timed out/overloaded (502-504) calls, calls fail fast for
+    # BREAKER_COOLDOWN seconds until one trial call gets through. Meanwhile
+    # reads answer with their last good result if younger than STALE_MAX_AGE
+    # seconds (0 = never serve stale data)
+    PVE_BREAKER_FAILURES: int = 5
+    PVE_BREAKER_COOLDOWN: int = 30
+    PVE_STALE_MAX_AGE: int = 600
+    PVE_STALE_CACHE_SIZE: int = 4096
+    # Async client connection pool (pveproxy speaks HTTP/1.1; HTTP/2 needs the h2 package)
+    PVE_TIMEOUT: int = 5
+    PVE_MAX_CONNECTIONS: int = 50
+    PVE_MAX_KEEPALIVE: int = 20
+    PVE_KEEPALIVE_EXPIRY: int = 30
+    PVE_HTTP2: bool = False
+    # Bulk power actions: max concurrent PVE calls, and the number of VMs on
+    # one node from which a single node-level startall is used instead
+    PVE_BULK_CONCURRENCY: int = 10
+    PVE_BULK_STARTALL_MIN: int = 5
+    # Batch cloning: clone tasks running at once per target node, how long an
+    # allocated VMID stays reserved, and PVE task polling (seconds)
+    PVE_CLONE_CONCURRENCY_PER_NODE: int = 2
+    VMID_RESERVATION_TTL: int = 600
+    PVE_TASK_POLL_INTERVAL: int = 2
+    PVE_TASK_TIMEOUT: int = 1800
+    # Max entries fetched per node when polling the task list
+    PVE_TASK_LIST_LIMIT: int = 500
+    # Target node of clones that do not name one: least-loaded (CPU/memory),
+    # spread (fewest desktops), bin-pack (fill nodes up to PVE_PLACEMENT_MAX_LOAD
+    # CPU/memory first) or template (the template's node)
+    PVE_PLACEMENT_STRATEGY: str = "least-loaded"
+    PVE_PLACEMENT_MAX_LOAD: float = 0.85
+    # Seconds a VM config (ostype, template flag) / guest agent IP stays cached
+    PVE_CONFIG_CACHE_TTL: int = 300
+    PVE_CONFIG_CACHE_SIZE: int = 4096
+    # Config fetches an inventory refresh runs at once (cache misses), so
+    # they leave room in the connection pool for user requests
+    PVE_CONFIG_FETCH_CONCURRENCY: int = 8
+    PVE_IP_CACHE_TTL: int = 60
+    # Guest agent IP lookups: how many run at once, per-VM deadline (seconds),
+    # how long failures/missing agents are remembered, and how long an
+    # expired IP may still be served while it is refreshed
+    PVE_AGENT_WORKERS: int = 16
+    PVE_AGENT_TIMEOUT: int = 3
+    PVE_IP_NEGATIVE_TTL: int = 120
+    PVE_IP_MAX_STALE: int = 600
+    # Seconds between background inventory refreshes (0 = fetch live per request)
+    INVENTORY_POLL_INTERVAL: int = 5
     
+    # VNC relay: frames buffered per direction before backpressure applies
+    VNC_RELAY_QUEUE_SIZE: int = 64
+    # Opt-in WAN mode for VNC sessions (?compress=1&coalesce=1): deflate
+    # defaults (overridable per session with ?level= and ?window=), and how
+    # long / how many bytes of server frames are coalesced before sending
+    VNC_DEFLATE_LEVEL: int = 6
+    VNC_DEFLATE_WINDOW_BITS: int = 12
+    VNC_DEFLATE_MEM_LEVEL: int = 5
+    VNC_COALESCE_MS: int = 5
+    VNC_COALESCE_MAX_BYTES: int = 65536
+    # Standalone console gateway (python -m app.vnc_gateway). VNC_GATEWAY_URL is
+    # the address browsers use, e.g. wss://vdi.example.com:8001; empty = via API
+    VNC_GATEWAY_URL: str = ""
+    VNC_GATEWAY_HOST: str = "0.0.0.0"
+    VNC_GATEWAY_PORT: int = 8001
+    VNC_GATEWAY_WORKERS: int = 0  # 0 = one per CPU
+    # Lifetime of the signed connection token returned by /vnc-ticket
+    VNC_TOKEN_EXPIRE_SECONDS: int = 60
+    # Seconds a prefetched vncproxy ticket is kept (PVE waits ~10s; 0 = off)
+    VNC_PREFETCH_TTL: int = 8
+    # Seconds an upstream socket opened by /vnc-connect waits for the browser
+    VNC_CONNECT_TTL: int = 10
+
+    # Level of the application log (DEBUG, INFO, WARNING, ERROR)
+    LOG_LEVEL: str = "INFO"
+    # Serve Prometheus metrics on /metrics (unauthenticated; restrict at the proxy)
+    METRICS_ENABLED: bool = True
+    # Request profiling (/system/traces): keep the span tree of this fraction
+    # of requests and of every request slower than PROFILING_SLOW_MS
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.01
+    PROFILING_SLOW_MS: int = 1000
+    PROFILING_BUFFER_SIZE: int = 100
+
     # Security
     SECRET_KEY: str = ""
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Seconds an authenticated user (and its owned VMs) is cached in-process
+    PRINCIPAL_CACHE_TTL: int = 30
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    # bcrypt cost; hashes with another cost are re-hashed on login
+    BCRYPT_ROUNDS: int = 12
+    # Processes used for password hashing/verification
+    PASSWORD_HASH_WORKERS: int = 2
+    # Login throttling: concurrent attempts, and failed attempts per minute
+    LOGIN_MAX_CONCURRENT_PER_USER: int = 2
+    LOGIN_MAX_CONCURRENT_PER_IP: int = 16
+    LOGIN_MAX_FAILURES_PER_USER: int = 10
+    LOGIN_MAX_FAILURES_PER_IP: int = 100
+    # Usernames and IPs with recent failures that are remembered (least recent dropped first)
+    LOGIN_TRACKED_KEYS: int = 10000
     
     # Database
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///./pve_vdi.db"
+    # Engine profile: "auto" (from the URI), "sqlite" or "postgresql"
+    DB_PROFILE: str = "auto"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # SQLite profile pragmas (WAL and synchronous=NORMAL are always applied)
+    SQLITE_BUSY_TIMEOUT: int = 5000  # ms
+    SQLITE_MMAP_SIZE: int = 268435456  # bytes
+    SQLITE_CACHE_SIZE: int = -65536  # negative = KiB
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -26,4 +168,33 @@ class Settings(BaseSettings):
         case_sensitive=True
     )
 
+    @property
+    def pve_cluster_configs(self) -> List[PVEClusterConfig]:
+        if self.PVE_CLUSTERS:
+            return self.PVE_CLUSTERS
+        return [PVEClusterConfig(
+            name=self.PVE_CLUSTER_NAME,
+            host=self.PVE_HOST,
+            port=self.PVE_PORT,
+            user=self.PVE_USER,
+            token_name=self.PVE_TOKEN_NAME,
+            token_value=self.PVE_TOKEN_VALUE,
+            verify_ssl=self.PVE_VERIFY_SSL,
+            hosts=self.PVE_HOSTS,
+        )]
+
+    @property
+    def default_cluster(self) -> str:
+        return self.pve_cluster_configs[0].name
+
+    def pve_cluster_config(self, name: str = None) -> PVEClusterConfig:
+        """
+        Config of the named cluster (the default one for None); KeyError if unknown.
+        """
+        name = name or self.default_cluster
+        for cluster in self.pve_cluster_configs:
+            if cluster.name == name:
+                return cluster
+        raise KeyError(f"Unknown cluster: {name}")
+
 settings = Settings()
@@ -1,18 +1,100 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.metrics import instrument_engine
 
-engine = create_engine(
-    settings.SQLALCHEMY_DATABASE_URI, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async DBAPI drivers used for each profile
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _profile(url) -> str:
+    if settings.DB_PROFILE != "auto":
+        return settings.DB_PROFILE
+    return "sqlite" if url.get_backend_name() == "sqlite" else "postgresql"
+
+
+def _pool_args():
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL is durable
+    # across app crashes in WAL mode and avoids an fsync per commit.
+    # busy_timeout makes concurrent writers wait instead of failing.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def build_engine(uri: str):
+    """
+    Async engine for the configured profile. Plain URIs (sqlite:///...,
+    postgresql://...) are switched to the aiosqlite / asyncpg drivers.
+
+    - postgresql: pool sized by DB_POOL_* with pre-ping
+    - sqlite: WAL and the SQLITE_* pragmas applied on every new connection;
+      file databases also get a sized pool
+    """
+    url = make_url(uri)
+    profile = _profile(url)
+    if profile not in ASYNC_DRIVERS:
+        raise ValueError(f"Unknown DB_PROFILE: {profile}")
+    if url.drivername in (profile, f"{profile}+psycopg2", f"{profile}+pysqlite"):
+        url = url.set(drivername=ASYNC_DRIVERS[profile])
+
+    kwargs = {}
+    if profile == "postgresql" or url.database not in (None, "", ":memory:"):
+        kwargs.update(_pool_args())
+    engine = create_async_engine(url, **kwargs)
+    if profile == "sqlite":
+        event.listen(engine.sync_engine, "connect", _sqlite_pragmas)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+engine = build_engine(settings.SQLALCHEMY_DATABASE_URI)
+# The one session factory; objects stay usable after commit
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def pool_status():
+    """
+    Connection pool counters of the engine, for /system/db.
+    """
+    pool = engine.sync_engine.pool
+    status = {
+        "profile": _profile(engine.url),
+        "dialect": engine.dialect.name,
+        "pool": type(pool).__name__,
+    }
+    # Only QueuePool-style pools keep these counters
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        counter = getattr(pool, name, None)
+        if counter is not None:
+            status[name] = counter()
+    status["status"] = pool.status()
+    return status
@@ -0,0 +1,313 @@
+"""
+In-process metrics in the Prometheus text format, served on /metrics.
+
+Counters, gauges and histograms with labels, plus the hooks that feed them:
+PVE client methods (instrumented), FastAPI routes (MetricsMiddleware) and
+SQL statements (instrument_engine). Values are per process. The PVE and SQL
+hooks also feed the request profiler's span trees.
+"""
+import asyncio
+import functools
+import threading
+import time
+from sqlalchemy import event
+from app.core import profiling
+
+# Seconds; spans a cached lookup up to a slow PVE clone call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        Yield (suffix, label names, label values, value).
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", self.labelnames, key, value
+
+
+class Gauge(_Metric):
+    """
+    A settable value, or one read from `function` at scrape time.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._function is not None:
+            yield "", (), (), self._function()
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", self.labelnames, key, value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # label values -> [bucket counts..., sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield "_bucket", names, key + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, key, entry[-1]
+            yield "_count", self.labelnames, key, cumulative
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# PVE API
+
+pve_request_duration = Histogram(
+    "pve_request_duration_seconds", "PVE client call latency", ("cluster", "client", "operation")
+)
+pve_request_errors = Counter(
+    "pve_request_errors_total", "PVE client calls that raised", ("cluster", "client", "operation", "error")
+)
+
+
+def instrumented(client: str, exclude=()):
+    """
+    Class decorator timing every public method of a PVE service into
+    pve_request_duration_seconds and counting failures per operation.
+    Services name their cluster in a `cluster` attribute.
+    """
+    def wrap(method):
+        operation = method.__name__
+        name = f"pve.{operation}"
+
+        def labels(service):
+            return {"cluster": service.cluster, "client": client, "operation": operation}
+
+        def failed(service, e):
+            pve_request_errors.inc(**labels(service), error=type(e).__name__)
+
+        def span_args(args, kwargs):
+            return repr(args[1:] + tuple(kwargs.items()))[:200]
+
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def timed(service, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with profiling.span(name, cluster=service.cluster, args=span_args((service,) + args, kwargs)):
+                        return await method(service, *args, **kwargs)
+                except Exception as e:
+                    failed(service, e)
+                    raise
+                finally:
+                    pve_request_duration.observe(time.perf_counter() - start, **labels(service))
+        else:
+            @functools.wraps(method)
+            def timed(service, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with profiling.span(name, cluster=service.cluster, args=span_args((service,) + args, kwargs)):
+                        return method(service, *args, **kwargs)
+                except Exception as e:
+                    failed(service, e)
+                    raise
+                finally:
+                    pve_request_duration.observe(time.perf_counter() - start, **labels(service))
+        return timed
+
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude or not callable(attr):
+                continue
+            setattr(cls, name, wrap(attr))
+        return cls
+
+    return decorate
+
+
+# HTTP
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "API request latency per route", ("method", "route", "status")
+)
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the matched route, e.g. /api/v1/vms/{vmid}. Routes of an
+    included router may only know their own part (/{vmid}); the prefix is
+    then taken from the request path.
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    try:
+        concrete = path_format.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return path_format
+    path = scope["path"]
+    if concrete and path.endswith(concrete):
+        return path[: len(path) - len(concrete)] + path_format
+    return path_format
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of each HTTP request under its
+    route template (/api/v1/vms/{vmid}), so label values stay bounded.
+    Time runs until the response has been sent, including streamed bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route_template(scope),
+                status=status,
+            )
+
+
+# Database
+
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("statement",)
+)
+db_query_errors = Counter("db_query_errors_total", "SQL statements that failed", ("statement",))
+
+
+def _statement_type(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def instrument_engine(engine):
+    """
+    Count and time every SQL statement run by `engine` (a sync Engine;
+    pass async_engine.sync_engine for an AsyncEngine).
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        end = time.perf_counter()
+        db_query_duration.observe(end - context._metrics_start, statement=_statement_type(statement))
+        profiling.add_span("sql", context._metrics_start, end, statement=statement[:500])
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        statement = exception_context.statement or ""
+        db_query_errors.inc(statement=_statement_type(statement))
+
+
+# Application
+
+errors = Counter("app_errors_total", "Errors handled and logged by the backend", ("component",))
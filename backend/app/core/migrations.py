@@ -0,0 +1,114 @@
+"""
+Versioned schema migrations for databases created by older releases.
+
+New databases get the full schema from create_all(); each migration here
+brings an existing database up to the same state and must be safe to run on
+either. Applied versions are recorded in the schema_migrations table, so
+every migration runs once per database, in order.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from app.core import database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _create_missing_indexes(conn, table_name: str):
+    table = database.Base.metadata.tables[table_name]
+    # Indexes on columns a later migration adds are left to that migration
+    columns = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    for index in table.indexes:
+        if all(column.name in columns for column in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+def _drop_stale_index(conn, table_name: str, index_name: str):
+    """
+    Drop the index if its definition differs from the model's, so that
+    _create_missing_indexes builds it again. Matching indexes are kept.
+    """
+    existing = {ix["name"]: ix for ix in inspect(conn).get_indexes(table_name)}.get(index_name)
+    if existing is None:
+        return
+    expected = next(ix for ix in database.Base.metadata.tables[table_name].indexes if ix.name == index_name)
+    if (
+        bool(existing["unique"]) != bool(expected.unique)
+        or existing["column_names"] != [column.name for column in expected.columns]
+    ):
+        conn.execute(text(f"DROP INDEX {index_name}"))
+
+
+def _0001_vm_task_indexes(conn):
+    """
+    Unique vms.vmid (per cluster since 0002), indexes on vms.node,
+    (owner_id, vmid), tasks.status and tasks.user_id.
+    """
+    existing = {ix["name"]: ix for ix in inspect(conn).get_indexes("vms")}
+    vmid_index = existing.get("ix_vms_vmid")
+    if vmid_index is not None and not vmid_index["unique"]:
+        duplicates = conn.execute(
+            text("SELECT vmid FROM vms GROUP BY vmid HAVING COUNT(*) > 1")
+        ).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                f"Cannot make vms.vmid unique, VMs managed more than once: {duplicates}. "
+                "Remove the duplicate records and restart."
+            )
+    _drop_stale_index(conn, "vms", "ix_vms_vmid")
+    _create_missing_indexes(conn, "vms")
+    _create_missing_indexes(conn, "tasks")
+
+
+def _0002_vm_cluster(conn):
+    """
+    vms.cluster and tasks.cluster; existing rows belong to the default
+    cluster. vms.vmid is unique per cluster instead of globally.
+    """
+    default = settings.default_cluster
+    vm_columns = {column["name"] for column in inspect(conn).get_columns("vms")}
+    if "cluster" not in vm_columns:
+        # DDL takes no bound parameters; quote the name as an SQL literal
+        quoted = default.replace("'", "''")
+        conn.execute(text(f"ALTER TABLE vms ADD COLUMN cluster VARCHAR NOT NULL DEFAULT '{quoted}'"))
+    task_columns = {column["name"] for column in inspect(conn).get_columns("tasks")}
+    if "cluster" not in task_columns:
+        conn.execute(text("ALTER TABLE tasks ADD COLUMN cluster VARCHAR"))
+        conn.execute(text("UPDATE tasks SET cluster = :default"), {"default": default})
+    _drop_stale_index(conn, "vms", "ix_vms_vmid")
+    _create_missing_indexes(conn, "vms")
+
+
+MIGRATIONS = [
+    ("0001_vm_task_indexes", _0001_vm_task_indexes),
+    ("0002_vm_cluster", _0002_vm_cluster),
+]
+
+
+def _upgrade(conn):
+    _meta.create_all(conn)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("Applying migration %s", version)
+        migrate(conn)
+        conn.execute(schema_migrations.insert().values(version=version))
+
+
+async def upgrade():
+    """
+    Create missing tables, then apply pending migrations in one transaction.
+    """
+    await database.create_tables()
+    async with database.engine.begin() as conn:
+        await conn.run_sync(_upgrade)
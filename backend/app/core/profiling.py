@@ -0,0 +1,177 @@
+"""
+Opt-in request profiling (PROFILING_ENABLED).
+
+Every HTTP request gets a span tree: the request itself, each PVE client call
+and each SQL statement made while handling it, nested as they ran. Trees of
+sampled requests (PROFILING_SAMPLE_RATE) and of slow ones
+(PROFILING_SLOW_MS) are kept in a bounded ring buffer for /system/traces.
+"""
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+
+# Spans recorded per request at most; the rest are only counted
+MAX_SPANS = 1000
+
+_current = ContextVar("profiling_span", default=None)
+_trace_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "trace")
+
+    def __init__(self, name: str, trace, start: float = None, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.children = []
+        self.trace = trace
+
+    def to_dict(self, origin: float):
+        end = self.end if self.end is not None else time.perf_counter()
+        result = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+        }
+        if self.attrs:
+            result["attrs"] = self.attrs
+        if self.children:
+            result["children"] = [child.to_dict(origin) for child in self.children]
+        return result
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.root = Span(name, self)
+        self.spans = 1
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add_child(self, parent: Span, span: Span) -> bool:
+        # Sync handlers run in worker threads and share the tree
+        with self._lock:
+            if self.spans >= MAX_SPANS:
+                self.dropped += 1
+                return False
+            self.spans += 1
+            parent.children.append(span)
+            return True
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Record a child span of the current request, if it is being profiled.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield
+        return
+    child = Span(name, parent.trace, attrs=attrs)
+    if not parent.trace.add_child(parent, child):
+        yield
+        return
+    token = _current.set(child)
+    try:
+        yield
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+
+
+def add_span(name: str, start: float, end: float, **attrs):
+    """
+    Record a finished child span (e.g. from an event hook with its own timing).
+    """
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(name, parent.trace, start=start, attrs=attrs)
+    child.end = end
+    parent.trace.add_child(parent, child)
+
+
+class TraceBuffer:
+    """
+    The last `maxsize` kept traces, oldest dropped first.
+    """
+
+    def __init__(self, maxsize: int):
+        self._traces = deque(maxlen=maxsize)
+
+    def add(self, trace: dict):
+        self._traces.append(trace)
+
+    def list(self, sort: str = "duration", limit: int = 20):
+        traces = list(self._traces)
+        if sort == "duration":
+            traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+        else:
+            traces.reverse()
+        return traces[:limit]
+
+    def clear(self):
+        self._traces.clear()
+
+    def __len__(self):
+        return len(self._traces)
+
+
+trace_buffer = TraceBuffer(settings.PROFILING_BUFFER_SIZE)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware tracing each HTTP request and keeping the sampled or
+    slow ones in trace_buffer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Imported here: metrics imports this module for its span hooks
+        from app.core.metrics import route_template
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        started_at = time.time()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current.set(trace.root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.root.end = time.perf_counter()
+            duration_ms = (trace.root.end - trace.root.start) * 1000
+            slow = duration_ms >= settings.PROFILING_SLOW_MS
+            if slow or random.random() < settings.PROFILING_SAMPLE_RATE:
+                trace_buffer.add({
+                    "id": next(_trace_ids),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_template(scope),
+                    "status": status,
+                    "started_at": started_at,
+                    "duration_ms": round(duration_ms, 3),
+                    "reason": "slow" if slow else "sampled",
+                    "spans": trace.spans,
+                    "dropped_spans": trace.dropped,
+                    "tree": trace.root.to_dict(trace.root.start),
+                })
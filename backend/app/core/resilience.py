@@ -0,0 +1,259 @@
+"""
+Keeping PVE brownouts away from the API workers.
+
+- AsyncSingleFlight: concurrent identical calls share one execution
+  instead of each hitting PVE.
+- CircuitBreaker: per API endpoint; after PVE_BREAKER_FAILURES consecutive
+  failures calls fail fast with PVEUnavailable instead of tying up a worker
+  for PVE_TIMEOUT each.
+- shared_read: both of the above for the read methods of the PVE client,
+  which answer with their last good result while PVE is unreachable.
+- Staleness tracking: such answers are noted for the current request and
+  StaleDataMiddleware reports their age in the X-PVE-Data-Age header.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+circuit_open = Gauge("pve_circuit_open", "PVE API endpoint circuit breaker open (1) or not", ("cluster", "endpoint"))
+circuit_rejected = Counter(
+    "pve_circuit_rejected_total", "PVE calls refused by an open circuit breaker", ("cluster", "endpoint")
+)
+coalesced_calls = Counter(
+    "pve_coalesced_calls_total", "PVE reads that joined an identical call in flight", ("cluster", "operation")
+)
+stale_reads = Counter(
+    "pve_stale_reads_total", "PVE reads answered with the last good result", ("cluster", "operation")
+)
+
+
+class PVEUnavailable(Exception):
+    """
+    Every API endpoint of a cluster is behind an open circuit breaker.
+    """
+
+    def __init__(self, cluster: str):
+        super().__init__(f"PVE cluster {cluster} is unavailable (circuit breaker open)")
+        self.cluster = cluster
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker of one PVE API endpoint. Closed: calls pass.
+    Open: calls are refused for PVE_BREAKER_COOLDOWN seconds. Then half-open:
+    one trial call passes and its outcome closes or re-opens the breaker.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, cluster: str, endpoint: str):
+        self.cluster = cluster
+        self.endpoint = endpoint
+        self.state = self.CLOSED
+        self.failures = 0  # consecutive
+        self.opened_at = None  # time.time()
+        self._since = 0.0  # monotonic time the breaker opened or the trial started
+        self._lock = threading.Lock()
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self._since >= settings.PVE_BREAKER_COOLDOWN
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether calls may be sent; unlike allow() this does not start a trial.
+        """
+        with self._lock:
+            return self.state != self.OPEN or self._cooled_down()
+
+    def allow(self) -> bool:
+        """
+        Whether to send a call now. Past the cooldown the caller becomes the
+        trial; a trial that never reports back is replaced after another one.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self._cooled_down():
+                self.state = self.HALF_OPEN
+                self._since = time.monotonic()
+                return True
+        circuit_rejected.inc(cluster=self.cluster, endpoint=self.endpoint)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            closed = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+        if closed:
+            circuit_open.set(0, cluster=self.cluster, endpoint=self.endpoint)
+            logger.info("PVE endpoint %s of cluster %s is back, circuit closed", self.endpoint, self.cluster)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if settings.PVE_BREAKER_FAILURES <= 0:
+                return
+            opened = self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= settings.PVE_BREAKER_FAILURES
+            )
+            if opened:
+                self.state = self.OPEN
+                self._since = time.monotonic()
+                self.opened_at = self.opened_at or time.time()
+        if opened:
+            circuit_open.set(1, cluster=self.cluster, endpoint=self.endpoint)
+            logger.warning(
+                "PVE endpoint %s of cluster %s failed %s times, circuit open for %ss",
+                self.endpoint, self.cluster, self.failures, settings.PVE_BREAKER_COOLDOWN,
+            )
+
+    def as_dict(self):
+        return {"state": self.state, "failures": self.failures, "opened_at": self.opened_at}
+
+
+class AsyncSingleFlight:
+    """
+    Concurrent calls of do() with the same key run `fn` once: the first caller
+    starts it, the ones arriving meanwhile get its result (or its exception).
+    The shared call runs as its own task, so a caller that is cancelled
+    (client gone) does not cancel it for the rest.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Task
+
+    async def do(self, key, fn):
+        """
+        Await `fn()` or join the identical call in flight; returns (result, shared).
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(functools.partial(self._done, key))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller went away
+
+
+def shared_read(method):
+    """
+    Decorator for the read methods of AsyncPVEService. Calls with the same
+    arguments in flight at the same time share one PVE request.
+    When the read fails because PVE cannot be reached (service._unavailable),
+    the last good result of the same call is returned and noted as stale.
+    Results are shared between callers: do not modify them beyond adding keys.
+    """
+    operation = method.__name__
+
+    def remember(service, key, result):
+        if settings.PVE_STALE_MAX_AGE > 0:
+            service.last_good.set(key, (time.time(), result))
+
+    def fallback(service, key, error):
+        entry = service.last_good.get(key) if service._unavailable(error) else None
+        if entry is None:
+            return None
+        stale_reads.inc(cluster=service.cluster, operation=operation)
+        note_stale(entry[0])
+        return entry
+
+    @functools.wraps(method)
+    async def wrapper(service, *args, **kwargs):
+        key = (operation, args, tuple(sorted(kwargs.items())))
+
+        async def load():
+            result = await method(service, *args, **kwargs)
+            remember(service, key, result)
+            return result
+
+        try:
+            result, shared = await service._inflight.do(key, load)
+        except Exception as e:
+            entry = fallback(service, key, e)
+            if entry is None:
+                raise
+            return entry[1]
+        if shared:
+            coalesced_calls.inc(cluster=service.cluster, operation=operation)
+        return result
+    return wrapper
+
+
+# Staleness of the data behind the current request
+
+class StaleMarker:
+    def __init__(self):
+        self.since = None  # time.time() of the oldest stale data used
+
+    def note(self, since: float):
+        if since is not None and (self.since is None or since < self.since):
+            self.since = since
+
+
+_stale_marker = contextvars.ContextVar("pve_stale_marker", default=None)
+
+
+@contextmanager
+def track_staleness():
+    """
+    Collect the age of stale data used inside the block (including worker
+    threads started with a copy of the context, as run_in_threadpool does).
+    """
+    marker = StaleMarker()
+    token = _stale_marker.set(marker)
+    try:
+        yield marker
+    finally:
+        _stale_marker.reset(token)
+
+
+def note_stale(since: float):
+    """
+    Record that the current request uses data last known good at `since`.
+    """
+    marker = _stale_marker.get()
+    if marker is not None:
+        marker.note(since)
+
+
+class StaleDataMiddleware:
+    """
+    ASGI middleware adding X-PVE-Data-Age (seconds) to responses built from
+    stale PVE data, so clients can tell a brownout from a quiet cluster.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_staleness() as marker:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and marker.since is not None:
+                    age = max(int(time.time() - marker.since), 0)
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"x-pve-data-age", str(age).encode()),
+                    ]}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -1,17 +1,59 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import jwt
+from jose import jwt, JWTError
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Stored hashes with a different cost are upgraded on the next login
+# (verify_and_update), so BCRYPT_ROUNDS can be tuned against measured latency.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    """
+    Returns (valid, new_hash); new_hash is set when the stored hash uses
+    outdated parameters and should be replaced.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt is CPU-bound and holds the GIL for most of its run: hash in a small
+# process pool so a login storm cannot starve the event loop or other handlers
+_hash_pool = None
+
+def _get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            # Forking a process that already runs threads is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_hash_pool(), verify_and_update_password, plain_password, hashed_password
+    )
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_pool(), get_password_hash, password)
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -21,3 +63,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
+
+def create_vnc_token(user_id: int, cluster: str, node: str, vmid: int, port, ticket: str, host=None):
+    """
+    Short-lived token for one console connection. It carries the PVE VNC
+    ticket (and the (host, port) of the VM's node, if known), so the gateway
+    can open the console without a DB or API lookup.
+    """
+    expire = datetime.utcnow() + timedelta(seconds=settings.VNC_TOKEN_EXPIRE_SECONDS)
+    to_encode = {
+        "typ": "vnc",
+        "uid": user_id,
+        "cluster": cluster,
+        "node": node,
+        "vmid": int(vmid),
+        "port": str(port),
+        "ticket": ticket,
+        "exp": expire,
+    }
+    if host:
+        to_encode["host"] = list(host)
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def decode_vnc_token(token: str) -> dict:
+    # Raises JWTError if the signature is bad or the token has expired
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    if payload.get("typ") != "vnc":
+        raise JWTError("Not a VNC token")
+    return payload
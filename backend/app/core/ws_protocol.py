@@ -0,0 +1,24 @@
+from urllib.parse import parse_qsl
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from app.services.vnc_relay import VNCSessionOptions
+
+VNC_PROXY_PATH = "/ws/vncproxy/"
+
+
+class VNCWebSocketProtocol(WebSocketsSansIOProtocol):
+    """
+    uvicorn WebSocket protocol that negotiates permessage-deflate per VNC
+    console connection from its query string (see VNCSessionOptions).
+
+    Plain uvicorn only has a server-wide --ws-per-message-deflate switch;
+    other WebSocket routes keep that behaviour. Run with:
+
+        uvicorn app.main:app --ws app.core.ws_protocol:VNCWebSocketProtocol
+    """
+
+    def handle_connect(self, event):
+        path, _, query = event.path.partition("?")
+        if VNC_PROXY_PATH in path:
+            factory = VNCSessionOptions.from_query(dict(parse_qsl(query))).deflate_factory()
+            self.conn.available_extensions = [factory] if factory else []
+        super().handle_connect(event)
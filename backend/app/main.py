@@ -1,13 +1,38 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api import auth, users, vms
-from app.core.database import engine, Base
+from app.api import auth, users, vms, tasks, system
+from app.core import database, metrics, migrations, profiling, resilience, security
+from app.services.inventory import inventory_poller
+from app.services.clusters import endpoint_monitor, pve_clusters
+from app.services.tasks import task_tracker
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every PVE API request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables and apply pending schema migrations
+    await migrations.upgrade()
+    # Health and latency of each cluster's API endpoints (PVE_ENDPOINT_POOL)
+    endpoint_monitor.start()
+    # Background PVE inventory refresh shared by all API handlers
+    inventory_poller.start()
+    # Watches PVE tasks (clone, start, ...) until they finish
+    task_tracker.start()
+    yield
+    await task_tracker.stop()
+    await inventory_poller.stop()
+    await endpoint_monitor.stop()
+    await pve_clusters.aclose()
+    await database.engine.dispose()
+    security.shutdown_hash_pool()
+
+app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -18,14 +43,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# X-PVE-Data-Age on responses served from last-known-good PVE data
+app.add_middleware(resilience.StaleDataMiddleware)
+# Per-route request latency for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Span trees of sampled and slow requests for /system/traces
+if settings.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
 app.include_router(vms.router, prefix=f"{settings.API_V1_STR}/vms", tags=["vms"])
+app.include_router(tasks.router, prefix=f"{settings.API_V1_STR}/tasks", tags=["tasks"])
+app.include_router(system.router, prefix=f"{settings.API_V1_STR}/system", tags=["system"])
+
+@app.exception_handler(resilience.PVEUnavailable)
+async def pve_unavailable_handler(request, exc: resilience.PVEUnavailable):
+    # Circuit open: tell clients when it is worth trying again
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(settings.PVE_BREAKER_COOLDOWN)},
+    )
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from app.core.ws_protocol import VNCWebSocketProtocol
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws=VNCWebSocketProtocol)
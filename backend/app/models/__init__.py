@@ -1,3 +1,4 @@
 from app.core.database import Base
 from .user import User
 from .vm import VM
+from .task import Task
@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from app.core.database import Base
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upid = Column(String, unique=True, index=True) # PVE task ID
+    cluster = Column(String, nullable=True) # PVE cluster name; NULL for tasks from before clusters
+    node = Column(String)
+    vmid = Column(Integer, index=True, nullable=True)
+    type = Column(String) # e.g. qmstart, qmclone, startall
+    # 'running' or 'stopped'; exitstatus is 'OK' or the PVE error once stopped
+    status = Column(String, default="running", index=True)
+    exitstatus = Column(String, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
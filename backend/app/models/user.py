@@ -11,4 +11,5 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
 
-    vms = relationship("VM", back_populates="owner")
+    # Listings use selectinload(User.vms); an implicit lazy load raises
+    vms = relationship("VM", back_populates="owner", lazy="raise")
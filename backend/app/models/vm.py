@@ -1,14 +1,24 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
+from app.core.config import settings
 from app.core.database import Base
 
 class VM(Base):
     __tablename__ = "vms"
 
     id = Column(Integer, primary_key=True, index=True)
+    # PVE cluster name (see PVE_CLUSTERS); a VMID is managed at most once per cluster
+    cluster = Column(String, nullable=False, index=True, default=lambda: settings.default_cluster)
     vmid = Column(Integer, index=True) # PVE VM ID
-    node = Column(String) # PVE Node Name
+    node = Column(String, index=True) # PVE Node Name
     name = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
 
-    owner = relationship("User", back_populates="vms")
+    # Load explicitly (selectinload) where needed; lazy loads would be N+1
+    owner = relationship("User", back_populates="vms", lazy="raise")
+
+    __table_args__ = (
+        # Per-user listing and ownership checks: WHERE owner_id = ? [AND vmid = ?]
+        Index("ix_vms_owner_id_vmid", "owner_id", "vmid"),
+        Index("ix_vms_cluster_vmid", "cluster", "vmid", unique=True),
+    )
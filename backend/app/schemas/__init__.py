@@ -1,3 +1,4 @@
 from .user import User, UserCreate
-from .vm import VM, VMCreate, VMDetail
+from .vm import VM, VMCreate, VMBatchCreate, VMDetail, VMBulkAction, VMActionResult
 from .token import Token, TokenData
+from .task import Task
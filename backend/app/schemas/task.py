@@ -0,0 +1,18 @@
+from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel
+
+class Task(BaseModel):
+    upid: str
+    cluster: Optional[str] = None
+    node: str
+    vmid: Optional[int] = None
+    type: Optional[str] = None
+    status: str
+    exitstatus: Optional[str] = None
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
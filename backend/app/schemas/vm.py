@@ -1,15 +1,36 @@
-from typing import Optional, List
+from typing import Optional, List, Literal
 from pydantic import BaseModel
 
 class VMBase(BaseModel):
+    # PVE cluster name; the default cluster when omitted
+    cluster: Optional[str] = None
     vmid: int
     node: str
     name: str
 
 class VMCreate(VMBase):
     owner_id: int
+    # Node to clone to; picked by the placement strategy when omitted
+    target_node: Optional[str] = None
+    # Placement strategy (default PVE_PLACEMENT_STRATEGY)
+    strategy: Optional[str] = None
+
+class VMBatchCreate(BaseModel):
+    # Template to clone from; clones are made in the same cluster
+    cluster: Optional[str] = None
+    vmid: int
+    node: str
+    name_prefix: str
+    # One clone per entry; the same owner may appear several times
+    owner_ids: List[int]
+    # Nodes to spread the clones over round-robin; otherwise each clone is
+    # placed by the placement strategy (default PVE_PLACEMENT_STRATEGY)
+    target_nodes: Optional[List[str]] = None
+    strategy: Optional[str] = None
+    full: bool = False
 
 class VMImport(BaseModel):
+    cluster: Optional[str] = None
     vmid: int
     node: str
     name: str
@@ -32,4 +53,21 @@ class VMDetail(VM):
     os_type: Optional[str] = None
     ip: Optional[str] = None
     # Sync status: 'ok', 'orphan' (pve only), 'missing' (db only)
-    sync_status: str = 'ok' 
+    sync_status: str = 'ok'
+
+VMAction = Literal['start', 'stop', 'shutdown', 'reset']
+
+class VMBulkAction(BaseModel):
+    # All VMs of one action belong to one cluster
+    cluster: Optional[str] = None
+    vmids: List[int]
+    action: VMAction
+
+class VMActionResult(BaseModel):
+    cluster: Optional[str] = None
+    vmid: int
+    node: Optional[str] = None
+    # 'ok', 'error', 'not_found'
+    status: str
+    upid: Optional[str] = None
+    detail: Optional[str] = None
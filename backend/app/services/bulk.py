@@ -0,0 +1,50 @@
+import asyncio
+from collections import defaultdict
+from app.core.config import settings
+from app.services.clusters import pve_clusters
+
+
+async def run_bulk_action(action: str, targets):
+    """
+    Run a power action on many VMs concurrently.
+
+    `targets` is a list of (cluster, node, vmid). At most PVE_BULK_CONCURRENCY
+    PVE calls are in flight. Starting PVE_BULK_STARTALL_MIN or more VMs on one
+    node uses a single node-level startall instead of one call per VM.
+    Returns one result dict per VM: cluster, vmid, node, status ('ok'/'error'),
+    upid, detail.
+    """
+    semaphore = asyncio.Semaphore(settings.PVE_BULK_CONCURRENCY)
+    by_node = defaultdict(list)
+    for cluster, node, vmid in targets:
+        by_node[(cluster, node)].append(vmid)
+
+    async def single(cluster, node, vmid):
+        result = {"cluster": cluster, "vmid": vmid, "node": node}
+        async with semaphore:
+            try:
+                upid = await getattr(pve_clusters.get(cluster).api, f"{action}_vm")(node, vmid)
+                return [{**result, "status": "ok", "upid": upid}]
+            except Exception as e:
+                return [{**result, "status": "error", "detail": str(e)}]
+
+    async def node_start_all(cluster, node, vmids):
+        results = [{"cluster": cluster, "vmid": vmid, "node": node} for vmid in vmids]
+        async with semaphore:
+            try:
+                upid = await pve_clusters.get(cluster).api.start_all(node, vmids)
+                return [{**result, "status": "ok", "upid": upid} for result in results]
+            except Exception as e:
+                return [{**result, "status": "error", "detail": str(e)} for result in results]
+
+    jobs = []
+    for (cluster, node), vmids in by_node.items():
+        if action == 'start' and len(vmids) >= settings.PVE_BULK_STARTALL_MIN:
+            jobs.append(node_start_all(cluster, node, vmids))
+        else:
+            jobs.extend(single(cluster, node, vmid) for vmid in vmids)
+
+    results = []
+    for batch in await asyncio.gather(*jobs):
+        results.extend(batch)
+    return results
@@ -0,0 +1,67 @@
+from app.core.config import PVEClusterConfig, settings
+from app.core.resilience import CircuitBreaker
+from app.services.endpoints import EndpointMonitor, EndpointPool
+from app.services.pve_async import AsyncPVEService
+
+
+class PVECluster:
+    """
+    One configured PVE cluster with its API client, which uses an
+    EndpointPool if PVE_ENDPOINT_POOL is set, otherwise the circuit breaker
+    of the configured host.
+    """
+
+    def __init__(self, config: PVEClusterConfig):
+        self.name = config.name
+        self.config = config
+        self.endpoints = EndpointPool(config) if settings.PVE_ENDPOINT_POOL else None
+        self.breaker = None if self.endpoints else CircuitBreaker(config.name, f"{config.host}:{config.port}")
+        self.api = AsyncPVEService(config, self.endpoints, self.breaker)
+
+    def console_host(self, node: str):
+        """
+        (host, port) to open a console of a VM on `node` at: the node itself
+        when the pool knows it (no proxy hop through another pveproxy),
+        otherwise None for the configured host.
+        """
+        endpoint = self.endpoints.node_endpoint(node) if self.endpoints else None
+        return (endpoint.host, endpoint.port) if endpoint else None
+
+
+class ClusterRegistry:
+    """
+    The PVE clusters from settings.pve_cluster_configs, by name. The first one
+    is the default for requests and rows that do not name a cluster.
+    """
+
+    def __init__(self, configs):
+        self._clusters = {}
+        for config in configs:
+            if config.name in self._clusters:
+                raise ValueError(f"Duplicate PVE cluster name: {config.name}")
+            self._clusters[config.name] = PVECluster(config)
+        self.default = configs[0].name
+
+    def get(self, name: str = None) -> PVECluster:
+        cluster = self._clusters.get(name or self.default)
+        if cluster is None:
+            raise KeyError(f"Unknown cluster: {name}")
+        return cluster
+
+    @property
+    def names(self):
+        return list(self._clusters)
+
+    def __iter__(self):
+        return iter(list(self._clusters.values()))
+
+    def __len__(self):
+        return len(self._clusters)
+
+    async def aclose(self):
+        for cluster in self:
+            await cluster.api.aclose()
+
+
+pve_clusters = ClusterRegistry(settings.pve_cluster_configs)
+endpoint_monitor = EndpointMonitor(pve_clusters)
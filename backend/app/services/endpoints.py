@@ -0,0 +1,219 @@
+"""
+PVE API endpoint pool (PVE_ENDPOINT_POOL).
+
+Every cluster member runs pveproxy and answers any API call, so instead of
+sending everything to the configured host, calls go to the healthy member with
+the lowest latency. Members are discovered from /cluster/status and probed on
+/version every PVE_ENDPOINT_CHECK_INTERVAL seconds; failed calls mark a member
+down until its next successful probe. Each member also has a CircuitBreaker:
+while it is open the member gets no calls at all.
+"""
+import asyncio
+import logging
+import threading
+import time
+from app.core.config import PVEClusterConfig, settings
+from app.core.metrics import Gauge
+from app.core.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in an endpoint's latency average
+LATENCY_ALPHA = 0.3
+# pveproxy overloaded or restarting: worth asking another node
+RETRY_STATUSES = (502, 503, 504)
+
+endpoint_up = Gauge("pve_endpoint_up", "PVE API endpoint health (1 = up)", ("cluster", "endpoint"))
+endpoint_latency = Gauge(
+    "pve_endpoint_latency_seconds", "Moving average of PVE API endpoint latency", ("cluster", "endpoint")
+)
+
+
+class Endpoint:
+    """
+    One pveproxy address (host:port) and what is known about it.
+    """
+
+    def __init__(self, host: str, port: int, cluster: str):
+        self.host = host
+        self.port = port
+        self.breaker = CircuitBreaker(cluster, self.address)
+        self.nodes = set()  # cluster node names served at this address
+        self.healthy = True  # until proven otherwise
+        self.latency = None  # seconds, moving average
+        self.failures = 0  # consecutive
+        self.checked_at = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        return f"https://{self.host}:{self.port}/api2/json"
+
+    def as_dict(self):
+        return {
+            "address": self.address,
+            "nodes": sorted(self.nodes),
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "failures": self.failures,
+            "checked_at": self.checked_at,
+            "circuit": self.breaker.as_dict(),
+        }
+
+
+def _split_address(address: str, default_port: int):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "]" not in port:
+        return host.strip("[]"), int(port)
+    return address.strip("[]"), default_port
+
+
+class EndpointPool:
+    """
+    The API endpoints of one cluster, ranked by health and latency.
+    """
+
+    def __init__(self, config: PVEClusterConfig):
+        self.cluster = config.name
+        self.port = config.port
+        self._lock = threading.Lock()
+        self._endpoints = {}  # address -> Endpoint, configured hosts first
+        self._nodes = {}  # node name -> Endpoint
+        for address in [config.host] + list(config.hosts):
+            self._add(*_split_address(address, config.port))
+
+    def _add(self, host: str, port: int, node: str = None) -> Endpoint:
+        address = f"{host}:{port}"
+        endpoint = self._endpoints.get(address)
+        if endpoint is None:
+            endpoint = self._endpoints[address] = Endpoint(host, port, self.cluster)
+        if node is not None:
+            endpoint.nodes.add(node)
+            self._nodes[node] = endpoint
+        return endpoint
+
+    def candidates(self, count: int, include_open: bool = False):
+        """
+        Up to `count` endpoints to try in order: healthy ones by latency (not
+        yet measured first, so they get measured), then the rest by how long
+        they have been failing. Down endpoints are still tried last, so
+        calls do not fail just because every probe did; endpoints whose
+        circuit breaker is open are left out unless `include_open`.
+        """
+        with self._lock:
+            endpoints = list(self._endpoints.values())
+        if not include_open:
+            endpoints = [e for e in endpoints if e.breaker.available]
+        healthy = sorted(
+            (e for e in endpoints if e.healthy),
+            key=lambda e: -1 if e.latency is None else e.latency,
+        )
+        down = sorted((e for e in endpoints if not e.healthy), key=lambda e: e.failures)
+        return (healthy + down)[:max(count, 1)]
+
+    def record_success(self, endpoint: Endpoint, latency: float = None):
+        with self._lock:
+            if latency is not None and endpoint.latency is None:
+                endpoint.latency = latency
+            elif latency is not None:
+                endpoint.latency += LATENCY_ALPHA * (latency - endpoint.latency)
+            endpoint.failures = 0
+            endpoint.healthy = True
+        endpoint.breaker.record_success()
+        endpoint_up.set(1, cluster=self.cluster, endpoint=endpoint.address)
+        if endpoint.latency is not None:
+            endpoint_latency.set(endpoint.latency, cluster=self.cluster, endpoint=endpoint.address)
+
+    def record_failure(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.healthy = False
+        endpoint.breaker.record_failure()
+        endpoint_up.set(0, cluster=self.cluster, endpoint=endpoint.address)
+
+    def node_endpoint(self, node: str):
+        """
+        The healthy endpoint of cluster node `node`, or None if unknown or down.
+        """
+        with self._lock:
+            endpoint = self._nodes.get(node)
+        if endpoint is None or not endpoint.healthy or not endpoint.breaker.available:
+            return None
+        return endpoint
+
+    def snapshot(self):
+        with self._lock:
+            return [endpoint.as_dict() for endpoint in self._endpoints.values()]
+
+    async def refresh(self, client):
+        """
+        Learn the members from /cluster/status and probe every endpoint.
+        `client` is the cluster's authenticated httpx.AsyncClient.
+        """
+        for endpoint in self.candidates(len(self._endpoints), include_open=True):
+            try:
+                response = await client.get(f"{endpoint.url}/cluster/status")
+                response.raise_for_status()
+            except Exception:
+                continue
+            with self._lock:
+                for entry in response.json().get('data') or []:
+                    if entry.get('type') == 'node' and entry.get('ip'):
+                        member = self._add(entry['ip'], self.port, node=entry['name'])
+                        if not entry.get('online'):
+                            member.healthy = False
+            break
+        # Probes ignore the breakers: a successful one closes the circuit
+        endpoints = self.candidates(len(self._endpoints), include_open=True)
+        await asyncio.gather(*(self._probe(client, endpoint) for endpoint in endpoints))
+
+    async def _probe(self, client, endpoint: Endpoint):
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"{endpoint.url}/version", timeout=settings.PVE_TIMEOUT)
+            response.raise_for_status()
+        except Exception:
+            self.record_failure(endpoint)
+        else:
+            self.record_success(endpoint, time.perf_counter() - start)
+        finally:
+            endpoint.checked_at = time.time()
+
+
+class EndpointMonitor:
+    """
+    asyncio background task refreshing the endpoint pools of all clusters.
+    """
+
+    def __init__(self, clusters):
+        self.clusters = clusters
+        self._task = None
+
+    async def _run(self):
+        while True:
+            pools = [(cluster.endpoints, cluster.api.client) for cluster in self.clusters if cluster.endpoints]
+            results = await asyncio.gather(
+                *(pool.refresh(client) for pool, client in pools), return_exceptions=True
+            )
+            for (pool, _), result in zip(pools, results):
+                if isinstance(result, Exception):
+                    logger.warning("Endpoint check of cluster %s failed: %s", pool.cluster, result)
+            await asyncio.sleep(settings.PVE_ENDPOINT_CHECK_INTERVAL)
+
+    def start(self):
+        if not settings.PVE_ENDPOINT_POOL or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.services.cache import TTLCache
+
+
+def parse_agent_ip(data):
+    """
+    First non-loopback IPv4 address from a network-get-interfaces agent reply.
+    """
+    result = None
+    if isinstance(data, dict):
+        if 'result' in data:
+            result = data.get('result') or []
+        elif 'data' in data and isinstance(data['data'], dict):
+            result = data['data'].get('result') or []
+    if not result:
+        return None
+
+    for iface in result:
+        if iface.get('name') == 'lo':
+            continue
+        for addr in iface.get('ip-addresses', []):
+            if addr.get('ip-address-type') == 'ipv4':
+                ip = addr.get('ip-address')
+                if ip and not ip.startswith('127.'):
+                    return ip
+    return None
+
+
+class GuestIPResolver:
+    """
+    Resolves VM IPs through the QEMU guest agent, at most PVE_AGENT_WORKERS
+    lookups at a time.
+
+    - Lookups for many VMs run concurrently and the caller waits at most
+      PVE_AGENT_TIMEOUT seconds; slower VMs come back as None for now and
+      fill the cache when their call finishes.
+    - Successful lookups are cached for PVE_IP_CACHE_TTL, failures and
+      missing agents for PVE_IP_NEGATIVE_TTL.
+    - Expired entries are still returned while a refresh runs in the background.
+    """
+
+    def __init__(self, fetch):
+        self._fetch = fetch  # async (node, vmid) -> ip or None
+        self._slots = asyncio.Semaphore(settings.PVE_AGENT_WORKERS)
+        # key -> (expires_at, ip); entries outlive their TTL so they can be served stale
+        self.cache = TTLCache(maxsize=settings.PVE_CONFIG_CACHE_SIZE, ttl=settings.PVE_IP_MAX_STALE)
+        self._inflight = {}  # key -> asyncio.Task
+
+    async def _refresh(self, key):
+        try:
+            async with self._slots:
+                ip = await self._fetch(*key)
+        except Exception:
+            ip = None
+        ttl = settings.PVE_IP_CACHE_TTL if ip else settings.PVE_IP_NEGATIVE_TTL
+        self.cache.set(key, (time.monotonic() + ttl, ip))
+        return ip
+
+    def _submit(self, key):
+        task = self._inflight.get(key)
+        if task is None:
+            # A task of its own: it finishes even if the caller stops waiting
+            task = self._inflight[key] = asyncio.ensure_future(self._refresh(key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def resolve_many(self, keys):
+        """
+        Resolve IPs for a list of (node, vmid) keys. Returns {key: ip or None}.
+        """
+        results = {}
+        pending = {}
+        now = time.monotonic()
+        for key in keys:
+            entry = self.cache.get(key)
+            if entry is not None:
+                expires_at, ip = entry
+                results[key] = ip
+                if expires_at <= now:
+                    self._submit(key)
+            else:
+                pending[key] = self._submit(key)
+
+        if pending:
+            done, _ = await asyncio.wait(set(pending.values()), timeout=settings.PVE_AGENT_TIMEOUT)
+            for key, task in pending.items():
+                results[key] = task.result() if task in done else None
+        return results
+
+    async def resolve(self, node: str, vmid: int):
+        key = (node, int(vmid))
+        return (await self.resolve_many([key]))[key]
+
+    def invalidate(self, vmid: int):
+        vmid = int(vmid)
+        self.cache.invalidate_where(lambda key: key[1] == vmid)
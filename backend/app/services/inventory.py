@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from app.core.config import settings
+from app.core import metrics
+from app.core.resilience import AsyncSingleFlight, note_stale, track_staleness
+from app.services.clusters import pve_clusters
+from app.services.vm_status import vm_status_hub
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterState:
+    """
+    Shared in-memory snapshot of all PVE clusters (nodes, VMs, templates),
+    each entry tagged with its "cluster". Refreshed in the background by
+    InventoryPoller; API handlers only read it.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.vms = []
+        self.updated_at = None  # time.time() of the last successful refresh
+        self.last_error = None
+        # Per cluster: {"nodes", "vms", "updated_at", "error", "stale_since"};
+        # a cluster that fails to refresh keeps its last snapshot, and
+        # stale_since says since when its data has not been current
+        self.clusters = {}
+        self._inflight = AsyncSingleFlight()
+
+    @property
+    def ready(self) -> bool:
+        return self.updated_at is not None
+
+    @property
+    def templates(self):
+        return [vm for vm in self.vms if vm.get('template') == 1]
+
+    @property
+    def stale_since(self):
+        """
+        When the oldest out-of-date cluster snapshot was current, or None.
+        """
+        since = [state["stale_since"] for state in self.clusters.values() if state.get("stale_since")]
+        return min(since, default=None)
+
+    @staticmethod
+    async def _load(cluster):
+        # PVE reads fall back to their last good result while the cluster is unreachable
+        with track_staleness() as marker:
+            nodes = await cluster.api.get_nodes()
+            vms = await cluster.api.get_vm_inventory()
+        for item in nodes + vms:
+            item['cluster'] = cluster.name
+        return nodes, vms, marker.since
+
+    async def refresh(self):
+        """
+        Reload every cluster, concurrently. Raises only if all of them failed.
+        Callers arriving while a refresh runs wait for it instead of starting
+        another one.
+        """
+        await self._inflight.do("refresh", self._refresh)
+
+    async def _refresh(self):
+        clusters = list(pve_clusters)
+        results = await asyncio.gather(*(self._load(cluster) for cluster in clusters), return_exceptions=True)
+        loaded, errors = {}, {}
+        for cluster, result in zip(clusters, results):
+            if isinstance(result, Exception):
+                errors[cluster.name] = str(result)
+            else:
+                loaded[cluster.name] = result
+        now = time.time()
+        states = dict(self.clusters)
+        for name, (nodes, vms, stale_since) in loaded.items():
+            states[name] = {"nodes": nodes, "vms": vms, "updated_at": now, "error": None, "stale_since": stale_since}
+        for name, error in errors.items():
+            state = states.get(name, {"nodes": [], "vms": [], "updated_at": None, "stale_since": None})
+            states[name] = {**state, "error": error, "stale_since": state["stale_since"] or state["updated_at"]}
+        # Swap whole lists so readers never see a half-updated snapshot
+        self.clusters = states
+        self.nodes = [node for state in states.values() for node in state["nodes"]]
+        self.vms = [vm for state in states.values() for vm in state["vms"]]
+        self.last_error = "; ".join(f"{name}: {error}" for name, error in errors.items()) or None
+        if loaded:
+            self.updated_at = now
+        if not loaded:
+            raise RuntimeError(self.last_error)
+        for name, error in errors.items():
+            metrics.errors.inc(component="inventory")
+            logger.warning("Inventory refresh of cluster %s failed: %s", name, error)
+
+    async def aget(self):
+        """
+        Return the state, loading it live if the poller is disabled
+        or has not completed its first refresh yet.
+        """
+        if not self.ready or settings.INVENTORY_POLL_INTERVAL <= 0:
+            await self.refresh()
+        note_stale(self.stale_since)
+        return self
+
+
+class InventoryPoller:
+    """
+    asyncio background task that refreshes a ClusterState on a fixed interval.
+    """
+
+    def __init__(self, state: ClusterState):
+        self.state = state
+        self._task = None
+        self._loop = None
+        self._wakeup = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.state.refresh()
+                # Push what changed to the status WebSocket subscribers
+                vm_status_hub.publish(self.state.vms)
+            except Exception as e:
+                self.state.last_error = str(e)
+                metrics.errors.inc(component="inventory")
+                logger.warning("Inventory refresh failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INVENTORY_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if settings.INVENTORY_POLL_INTERVAL <= 0 or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+
+    def trigger(self):
+        """
+        Ask for an early refresh (e.g. after a VM was cloned or started).
+        Safe to call from sync handlers running in the threadpool.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+
+cluster_state = ClusterState()
+inventory_poller = InventoryPoller(cluster_state)
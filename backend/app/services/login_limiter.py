@@ -0,0 +1,88 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from app.core.config import settings
+from app.services.cache import TTLCache
+
+FAILURE_WINDOW = 60  # seconds
+
+
+class LoginThrottled(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LoginLimiter:
+    """
+    Per-username and per-client-IP limits for login attempts:
+
+    - concurrency: attempts in flight at once (stampedes, parallel guessing)
+    - failures: failed attempts in the last minute (brute force)
+
+    Over a limit the attempt is refused before any bcrypt work is done.
+    Per-IP limits are generous because a classroom often shares one NAT address.
+    Keys come from the client, so failures are kept for at most
+    LOGIN_TRACKED_KEYS of them, each until a minute after its last failure.
+    """
+
+    def __init__(self):
+        self._inflight = defaultdict(int)  # key -> attempts in flight
+        # key -> monotonic times of failures
+        self._failures = TTLCache(maxsize=settings.LOGIN_TRACKED_KEYS, ttl=FAILURE_WINDOW)
+
+    def _limits(self, username: str, ip: str):
+        return [
+            (("user", username.lower()), settings.LOGIN_MAX_CONCURRENT_PER_USER, settings.LOGIN_MAX_FAILURES_PER_USER),
+            (("ip", ip), settings.LOGIN_MAX_CONCURRENT_PER_IP, settings.LOGIN_MAX_FAILURES_PER_IP),
+        ]
+
+    def _recent_failures(self, key, now: float):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - FAILURE_WINDOW:
+            failures.popleft()
+        if not failures:
+            self._failures.invalidate(key)
+            return None
+        return failures
+
+    @contextmanager
+    def attempt(self, username: str, ip: str):
+        """
+        Guard one login attempt. Raises LoginThrottled if over a limit; the
+        body calls record_failure() when the credentials are wrong.
+        """
+        now = time.monotonic()
+        limits = self._limits(username, ip)
+        for key, max_inflight, max_failures in limits:
+            failures = self._recent_failures(key, now)
+            if failures is not None and len(failures) >= max_failures:
+                retry_after = int(failures[0] + FAILURE_WINDOW - now) + 1
+                raise LoginThrottled(f"Too many failed logins for this {key[0]}", retry_after)
+            if self._inflight[key] >= max_inflight:
+                raise LoginThrottled(f"Too many concurrent logins for this {key[0]}", 1)
+
+        keys = [key for key, _, _ in limits]
+        for key in keys:
+            self._inflight[key] += 1
+        try:
+            yield
+        finally:
+            for key in keys:
+                self._inflight[key] -= 1
+                if self._inflight[key] <= 0:
+                    del self._inflight[key]
+
+    def record_failure(self, username: str, ip: str):
+        now = time.monotonic()
+        for key, _, max_failures in self._limits(username, ip):
+            failures = self._recent_failures(key, now) or deque(maxlen=max(max_failures, 1))
+            failures.append(now)
+            # Re-set so the entry lives until a window after its newest failure
+            self._failures.set(key, failures)
+
+
+login_limiter = LoginLimiter()
@@ -0,0 +1,271 @@
+"""
+Target node selection for new clones (PVE_PLACEMENT_STRATEGY).
+
+Candidates are the online nodes that can take the clone: PVE clones to
+another node only when the template's disks are on shared storage, and a
+full clone needs room for the template's disks there. Node load comes from
+the inventory snapshot (CPU, memory, running and total desktops per node)
+and /cluster/resources (storage free space). A strategy from STRATEGIES
+picks the node of each clone; placements count against their node until the
+inventory shows the clone, so a batch, or clones requested at the same
+time, do not all land on the same node.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+from app.core.config import settings
+from app.services.inventory import cluster_state
+
+logger = logging.getLogger(__name__)
+
+# VM config keys holding disks ("<storage>:<volume>,<options>")
+DISK_KEY = re.compile(r"^(ide|sata|scsi|virtio|efidisk|tpmstate)\d+$")
+
+
+class PlacementError(Exception):
+    """
+    No node can take the clone.
+    """
+
+
+class Demand:
+    """
+    What one clone of a template adds to its node.
+    """
+
+    def __init__(self, mem: int, disk: int, storages):
+        self.mem = mem  # bytes of guest memory, once the desktop runs
+        self.disk = disk  # bytes on the template's storage (full clones only)
+        self.storages = storages  # storage names the template's disks are on
+
+
+class NodeLoad:
+    """
+    A node as the scheduler sees it, including clones placed on it that
+    the inventory does not show yet.
+    """
+
+    def __init__(self, node: dict, running: int, desktops: int, storage_free=None):
+        self.name = node['node']
+        self.cpu = node.get('cpu') or 0.0  # 0-1
+        self.maxcpu = node.get('maxcpu') or 0
+        self.mem = node.get('mem') or 0
+        self.maxmem = node.get('maxmem') or 0
+        self.running = running
+        self.desktops = desktops
+        self.pending = 0  # placed, not in the inventory yet
+        self.storage_free = storage_free  # bytes on the template's storage, None if unknown
+        # CPU a desktop is expected to use once running: the node's current average
+        self.cpu_per_vm = self.cpu / running if running else 0.0
+
+    def _mem_ratio(self, extra: int = 0) -> float:
+        return (self.mem + extra) / self.maxmem if self.maxmem else 0.0
+
+    @property
+    def load(self) -> float:
+        """
+        The busier of CPU and memory, 0-1.
+        """
+        return max(self.cpu, self._mem_ratio())
+
+    def load_after(self, demand: Demand) -> float:
+        return max(self.cpu + self.cpu_per_vm, self._mem_ratio(demand.mem))
+
+    def fits(self, demand: Demand) -> bool:
+        return self.storage_free is None or self.storage_free >= demand.disk
+
+    def add(self, demand: Demand):
+        self.cpu += self.cpu_per_vm
+        self.mem += demand.mem
+        self.desktops += 1
+        self.pending += 1
+        if self.storage_free is not None:
+            self.storage_free -= demand.disk
+
+    def as_dict(self):
+        return {
+            "node": self.name,
+            "cpu": round(self.cpu, 4),
+            "mem": self.mem,
+            "maxmem": self.maxmem,
+            "load": round(self.load, 4),
+            "running": self.running,
+            "desktops": self.desktops,
+            "pending": self.pending,
+            "storage_free": self.storage_free,
+        }
+
+
+# Strategies: (candidate NodeLoads, Demand) -> the NodeLoad to clone to
+
+def least_loaded(nodes, demand: Demand) -> NodeLoad:
+    """
+    Lowest CPU/memory load after the clone; fewer running desktops break ties.
+    """
+    return min(nodes, key=lambda n: (n.load_after(demand), n.running, n.name))
+
+
+def spread(nodes, demand: Demand) -> NodeLoad:
+    """
+    Fewest desktops, so density stays even whether or not they are in use.
+    """
+    return min(nodes, key=lambda n: (n.desktops, n.load_after(demand), n.name))
+
+
+def bin_pack(nodes, demand: Demand) -> NodeLoad:
+    """
+    Busiest node that stays under PVE_PLACEMENT_MAX_LOAD with the clone, so
+    whole nodes stay free; least-loaded once every node is past the limit.
+    """
+    fitting = [n for n in nodes if n.load_after(demand) <= settings.PVE_PLACEMENT_MAX_LOAD]
+    if not fitting:
+        return least_loaded(nodes, demand)
+    return max(fitting, key=lambda n: (n.load, n.desktops))
+
+
+STRATEGIES = {
+    "least-loaded": least_loaded,
+    "spread": spread,
+    "bin-pack": bin_pack,
+}
+# Not scheduled: clone onto the template's node
+TEMPLATE = "template"
+
+
+def template_storages(config: dict):
+    """
+    Storages the disks in a VM config are on (CD-ROMs excluded).
+    """
+    storages = set()
+    for key, value in config.items():
+        if not DISK_KEY.match(key) or not isinstance(value, str) or "media=cdrom" in value:
+            continue
+        volume = value.split(",", 1)[0]
+        if ":" in volume:
+            storages.add(volume.split(":", 1)[0])
+    return storages
+
+
+class PlacementScheduler:
+    """
+    Picks clone target nodes with a strategy. Placements are per process
+    and per cluster, like VMID reservations, and are forgotten once the
+    inventory lists the clone or after VMID_RESERVATION_TTL seconds.
+    """
+
+    def __init__(self):
+        self._locks = defaultdict(asyncio.Lock)  # cluster -> Lock
+        self._pending = defaultdict(dict)  # cluster -> {vmid: (node, Demand, expires_at)}
+
+    def strategy(self, name: str = None) -> str:
+        name = name or settings.PVE_PLACEMENT_STRATEGY
+        if name != TEMPLATE and name not in STRATEGIES:
+            raise ValueError(f"Unknown placement strategy: {name}")
+        return name
+
+    async def node_loads(self, cluster, template_node: str = None, template_vmid: int = None, full: bool = False):
+        """
+        (NodeLoads of the nodes a clone of the template may go to, its Demand).
+        Without a template: every online node, and an empty demand.
+        """
+        state = (await cluster_state.aget()).clusters.get(cluster.name, {})
+        vms = state.get("vms", [])
+        demand = Demand(0, 0, set())
+        if template_vmid is not None:
+            template = next(
+                (vm for vm in vms if vm.get('vmid') == template_vmid and vm.get('node') == template_node), {}
+            )
+            config = await cluster.api.get_vm_config(template_node, template_vmid)
+            memory = int(config.get('memory') or 0) * 1024 ** 2 or template.get('maxmem') or 0
+            disk = (template.get('maxdisk') or 0) if full else 0
+            demand = Demand(memory, disk, template_storages(config))
+
+        try:
+            storage = await cluster.api.get_storage_resources()
+        except Exception as e:
+            logger.warning("Storage of cluster %s unavailable for placement: %s", cluster.name, e)
+            storage = None
+
+        names = [n['node'] for n in state.get("nodes", []) if n.get('status') == 'online']
+        free = {}
+        if demand.storages:
+            if storage is None:
+                # Cannot tell whether the template is on shared storage
+                names = [template_node]
+            else:
+                entries = {
+                    (s.get('node'), s.get('storage')): s for s in storage
+                    if s.get('storage') in demand.storages and s.get('status', 'available') == 'available'
+                }
+                if not entries or not all(s.get('shared') for s in entries.values()):
+                    # PVE only clones to another node from shared storage
+                    names = [template_node]
+                for name in names:
+                    node_entries = [entries.get((name, s)) for s in demand.storages]
+                    if all(node_entries):
+                        free[name] = min(int(s.get('maxdisk', 0)) - int(s.get('disk', 0)) for s in node_entries)
+
+        running, desktops = defaultdict(int), defaultdict(int)
+        for vm in vms:
+            if not vm.get('template'):
+                desktops[vm.get('node')] += 1
+                running[vm.get('node')] += vm.get('status') == 'running'
+        nodes = {n['node']: n for n in state.get("nodes", [])}
+        loads = {
+            name: NodeLoad(nodes.get(name, {'node': name}), running[name], desktops[name], free.get(name))
+            for name in names
+            # Other nodes lacking the template's storage cannot take the clone
+            if not demand.storages or storage is None or name in free or name == template_node
+        }
+
+        pending = self._pending[cluster.name]
+        listed = {int(vm['vmid']) for vm in vms if str(vm.get('vmid')).isdigit()}
+        now = time.monotonic()
+        for vmid, (name, placed, expires_at) in list(pending.items()):
+            if vmid in listed or expires_at <= now:
+                del pending[vmid]
+            elif name in loads:
+                loads[name].add(placed)
+        return list(loads.values()), demand
+
+    async def place(
+        self, cluster, template_node: str, template_vmid: int, vmids, full: bool = False, strategy: str = None
+    ):
+        """
+        Target node for each of `vmids`, new clones of the template, in order.
+        Raises ValueError for an unknown strategy and PlacementError if no
+        node can take a clone.
+        """
+        strategy = self.strategy(strategy)
+        if strategy == TEMPLATE:
+            return [template_node] * len(vmids)
+        choose = STRATEGIES[strategy]
+        async with self._locks[cluster.name]:
+            loads, demand = await self.node_loads(cluster, template_node, template_vmid, full)
+            pending = self._pending[cluster.name]
+            expires_at = time.monotonic() + settings.VMID_RESERVATION_TTL
+            targets = []
+            for vmid in vmids:
+                candidates = [n for n in loads if n.fits(demand)]
+                if not candidates:
+                    self.release(cluster.name, vmids)
+                    raise PlacementError(
+                        f"No online node of cluster {cluster.name} can take a clone of VM {template_vmid}"
+                    )
+                node = choose(candidates, demand)
+                node.add(demand)
+                pending[int(vmid)] = (node.name, demand, expires_at)
+                targets.append(node.name)
+            return targets
+
+    def release(self, cluster: str, vmids):
+        """
+        Forget placements of clones that will not be created.
+        """
+        for vmid in vmids:
+            self._pending[cluster].pop(int(vmid), None)
+
+
+placement_scheduler = PlacementScheduler()
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import defaultdict
+from sqlalchemy import delete
+from app.core import database, metrics
+from app.core.config import settings
+from app.models import vm as vm_model
+from app.services.cache import principal_cache
+from app.services.inventory import inventory_poller
+from app.services.clusters import pve_clusters
+from app.services.placement import placement_scheduler
+from app.services.tasks import UNKNOWN_STATUS, task_tracker
+from app.services.vm_status import vm_status_hub
+from app.services.vmid import vmid_allocator
+
+logger = logging.getLogger(__name__)
+
+# Keep references to running pipelines so they are not garbage collected
+_running = set()
+# Clone tasks running per (cluster, target node), shared by every clone path
+_node_limits = defaultdict(lambda: asyncio.Semaphore(settings.PVE_CLONE_CONCURRENCY_PER_NODE))
+
+
+def node_limit(cluster: str, node: str) -> asyncio.Semaphore:
+    """
+    Slot for one clone task onto `node`, held until the PVE task has finished.
+    """
+    return _node_limits[(cluster, node)]
+
+
+async def _release_when_done(slot: asyncio.Semaphore, upid: str):
+    try:
+        await task_tracker.wait(upid)
+    except Exception as e:
+        logger.warning("Clone task %s did not finish: %r", upid, e)
+    finally:
+        slot.release()
+
+
+def release_when_done(slot: asyncio.Semaphore, upid: str):
+    """
+    Free a node_limit() slot once the clone task `upid` has stopped.
+    """
+    task = asyncio.create_task(_release_when_done(slot, upid))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+
+async def run_batch_clone(
+    cluster: str, template_node: str, template_vmid: int, clones, full: bool = False, user_id: int = None
+):
+    """
+    Clone `template_vmid` of `cluster` once per entry of `clones` (dicts with
+    vmid, name, node).
+
+    Each target node runs at most PVE_CLONE_CONCURRENCY_PER_NODE clone tasks at a
+    time, counting other batches and single clones; a slot is held until the PVE
+    task has finished, so the storage of one node is never flooded. Clones PVE
+    failed have their VM record removed; clones whose outcome is unknown (the
+    task timed out or its status could not be read) keep it.
+    """
+    api = pve_clusters.get(cluster).api
+
+    async def clone_one(spec):
+        async with node_limit(cluster, spec['node']):
+            try:
+                upid = await api.clone_vm(
+                    node=template_node,
+                    vmid=template_vmid,
+                    newid=spec['vmid'],
+                    name=spec['name'],
+                    target_node=spec['node'] if spec['node'] != template_node else None,
+                    full=full,
+                )
+            except Exception as e:
+                logger.warning("Clone of VM %s failed: %s", spec['vmid'], e)
+                placement_scheduler.release(cluster, [spec['vmid']])
+                vmid_allocator.release(cluster, [spec['vmid']])
+                return spec['vmid']
+            try:
+                await task_tracker.register(upid, cluster, vmid=spec['vmid'], user_id=user_id)
+                exitstatus = await task_tracker.wait(upid)
+            except Exception as e:
+                exitstatus = None
+                logger.warning("Clone of VM %s: waiting for task %s failed: %r", spec['vmid'], upid, e)
+            finally:
+                vmid_allocator.release(cluster, [spec['vmid']])
+            if exitstatus in (None, UNKNOWN_STATUS):
+                # PVE may still finish the clone: keep the record (and so the
+                # VMID) and flag it; the task list shows how it ends
+                metrics.errors.inc(component="clone")
+                logger.warning("Clone of VM %s unconfirmed (task %s), keeping its record", spec['vmid'], upid)
+                return None
+            if exitstatus != 'OK':
+                logger.warning("Clone of VM %s failed: %s", spec['vmid'], exitstatus)
+                placement_scheduler.release(cluster, [spec['vmid']])
+                return spec['vmid']
+            return None
+
+    failed = [vmid for vmid in await asyncio.gather(*(clone_one(c) for c in clones)) if vmid is not None]
+    if failed:
+        async with database.SessionLocal() as db:
+            await db.execute(
+                delete(vm_model.VM).where(vm_model.VM.cluster == cluster, vm_model.VM.vmid.in_(failed))
+            )
+            await db.commit()
+        principal_cache.clear()
+        vm_status_hub.reload_owners()
+    inventory_poller.trigger()
+    return failed
+
+
+def start_batch_clone(*args, **kwargs):
+    """
+    Run run_batch_clone in the background and return the asyncio task.
+    """
+    task = asyncio.create_task(run_batch_clone(*args, **kwargs))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
@@ -0,0 +1,318 @@
+import asyncio
+import time
+import httpx
+from app.core.config import PVEClusterConfig, settings
+from app.core.metrics import instrumented
+from app.core.resilience import AsyncSingleFlight, CircuitBreaker, PVEUnavailable, shared_read
+from app.services.cache import TTLCache, vm_config_cache
+from app.services.endpoints import RETRY_STATUSES
+from app.services.guest_agent import GuestIPResolver, parse_agent_ip
+
+
+class PVEAPIError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+@instrumented("async", exclude=("invalidate_vm", "aclose"))
+class AsyncPVEService:
+    """
+    asyncio-native PVE API client for one cluster (see app.services.clusters),
+    used by the API handlers and the inventory refresh alike.
+
+    Requests go through one pooled httpx.AsyncClient, so connections (and their
+    TLS sessions) are kept alive and reused instead of being set up per call.
+    With an EndpointPool they go to its best node and fail over to others.
+    """
+
+    def __init__(self, cluster: PVEClusterConfig, endpoints=None, breaker=None):
+        self.cluster = cluster.name
+        self.config = cluster
+        self.endpoints = endpoints
+        if endpoints is None and breaker is None:
+            breaker = CircuitBreaker(cluster.name, f"{cluster.host}:{cluster.port}")
+        self.breaker = breaker
+        self.config_cache = vm_config_cache
+        self.ip_resolver = GuestIPResolver(self._fetch_vm_ip)
+        self._config_slots = asyncio.Semaphore(settings.PVE_CONFIG_FETCH_CONCURRENCY)
+        self._inflight = AsyncSingleFlight()
+        self.last_good = TTLCache(maxsize=settings.PVE_STALE_CACHE_SIZE, ttl=settings.PVE_STALE_MAX_AGE)
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"https://{self.config.host}:{self.config.port}/api2/json",
+                headers={"Authorization": self.authorization},
+                verify=self.config.verify_ssl,
+                http2=settings.PVE_HTTP2,
+                timeout=settings.PVE_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.PVE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.PVE_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.PVE_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+
+    @property
+    def authorization(self) -> str:
+        return f"PVEAPIToken={self.config.user}!{self.config.token_name}={self.config.token_value}"
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _unavailable(error) -> bool:
+        """
+        Whether `error` means PVE could not answer, rather than refused the call.
+        """
+        if isinstance(error, PVEAPIError):
+            return error.status_code in RETRY_STATUSES
+        return isinstance(error, (PVEUnavailable, httpx.TransportError))
+
+    async def _request(self, method: str, path: str, timeout=None, health=True, **kwargs):
+        """
+        Send a request, skipping endpoints whose circuit breaker is open
+        (PVEUnavailable if none is left). `health=False` keeps the outcome
+        out of the endpoint's health, for calls that time out for reasons of
+        their own (guest agent).
+        """
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if self.endpoints is None:
+            if not self.breaker.allow():
+                raise PVEUnavailable(self.cluster)
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError:
+                if health:
+                    self.breaker.record_failure()
+                raise
+            if response.status_code in RETRY_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return self._data(response)
+
+        error = None
+        for endpoint in self.endpoints.candidates(1 + settings.PVE_ENDPOINT_RETRIES):
+            if not endpoint.breaker.allow():
+                continue
+            start = time.perf_counter()
+            try:
+                # An absolute URL bypasses the client's base_url
+                response = await self.client.request(method, endpoint.url + path, **kwargs)
+            except httpx.TransportError as e:
+                if health:
+                    self.endpoints.record_failure(endpoint)
+                # Only reads are repeated, and writes that never reached PVE
+                if method != "GET" and not isinstance(e, httpx.ConnectError):
+                    raise
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                self.endpoints.record_failure(endpoint)
+                error = PVEAPIError(response.status_code, response.reason_phrase)
+                if method == "GET":
+                    continue
+                raise error
+            # Only reads are timed: writes include PVE's own work
+            self.endpoints.record_success(endpoint, time.perf_counter() - start if method == "GET" else None)
+            return self._data(response)
+        raise error or PVEUnavailable(self.cluster)
+
+    @staticmethod
+    def _data(response):
+        if response.status_code >= 400:
+            raise PVEAPIError(response.status_code, response.reason_phrase)
+        return response.json().get('data')
+
+    async def _get(self, path: str, **params):
+        return await self._request("GET", path, params=params or None)
+
+    async def _post(self, path: str, **data):
+        return await self._request("POST", path, data=data or None)
+
+    @shared_read
+    async def get_cluster_status(self):
+        return await self._get("/cluster/status")
+
+    @shared_read
+    async def get_cluster_resources(self):
+        return await self._get("/cluster/resources")
+
+    @shared_read
+    async def get_nodes(self):
+        return await self._get("/nodes")
+
+    @shared_read
+    async def get_node_status(self, node: str):
+        return await self._get(f"/nodes/{node}/status")
+
+    @shared_read
+    async def get_vms(self, node: str = None):
+        if node:
+            return await self._get(f"/nodes/{node}/qemu")
+
+        # Aggregate from all online nodes concurrently
+        nodes = [n['node'] for n in await self.get_nodes() if n.get('status') == 'online']
+        results = await asyncio.gather(
+            *(self._get(f"/nodes/{n}/qemu") for n in nodes), return_exceptions=True
+        )
+        vms = []
+        for n, node_vms in zip(nodes, results):
+            if isinstance(node_vms, Exception):
+                continue
+            for vm in node_vms:
+                vm['node'] = n
+            vms.extend(node_vms)
+        return vms
+
+    @shared_read
+    async def get_vm_resources(self):
+        resources = await self._get("/cluster/resources", type='vm')
+        return [r for r in resources if r.get('type') == 'qemu']
+
+    async def get_vm_inventory(self, vmids=None):
+        """
+        VM inventory: the cluster resources snapshot merged with the
+        cached config (ostype) and guest agent (ip) layers.
+        If vmids is given, only those VMs are returned and enriched.
+        """
+        vms = await self.get_vm_resources()
+        if vmids is not None:
+            vmids = {int(v) for v in vmids}
+            vms = [vm for vm in vms if vm.get('vmid') in vmids]
+        running = [(vm.get('node', ''), int(vm['vmid'])) for vm in vms if vm.get('status') == 'running']
+
+        async def ostype(vm):
+            # At most PVE_CONFIG_FETCH_CONCURRENCY config GETs when the cache has expired
+            async with self._config_slots:
+                return await self.get_vm_ostype(vm.get('node', ''), vm.get('vmid'))
+
+        ips, ostypes = await asyncio.gather(
+            self.ip_resolver.resolve_many(running),
+            asyncio.gather(*(ostype(vm) for vm in vms)),
+        )
+        for vm, ostype in zip(vms, ostypes):
+            vm['ostype'] = ostype
+            vm['ip'] = ips.get((vm.get('node', ''), int(vm['vmid'])))
+        return vms
+
+    @shared_read
+    async def get_storage_resources(self):
+        # Per node and storage: free space (maxdisk - disk) and the shared flag
+        resources = await self._get("/cluster/resources", type='storage')
+        return [r for r in resources if r.get('type') == 'storage']
+
+    @shared_read
+    async def get_vm_status(self, node: str, vmid: int):
+        return await self._get(f"/nodes/{node}/qemu/{vmid}/status/current")
+
+    @shared_read
+    async def get_vm_config(self, node: str, vmid: int):
+        key = (self.cluster, node, int(vmid))
+        config = self.config_cache.get(key)
+        if config is None:
+            config = await self._get(f"/nodes/{node}/qemu/{vmid}/config")
+            self.config_cache.set(key, config)
+        return config
+
+    async def update_vm_config(self, node: str, vmid: int, **params):
+        try:
+            return await self._request("PUT", f"/nodes/{node}/qemu/{vmid}/config", data=params)
+        finally:
+            self.invalidate_vm(vmid)
+
+    def invalidate_vm(self, vmid: int):
+        # Drop cached config and IP for this VMID on any node (covers migrations)
+        vmid = int(vmid)
+        self.config_cache.invalidate_where(lambda key: key[0] == self.cluster and key[2] == vmid)
+        self.ip_resolver.invalidate(vmid)
+
+    async def is_vm_template(self, node: str, vmid: int) -> bool:
+        try:
+            config = await self.get_vm_config(node, vmid)
+        except Exception:
+            return False
+        return bool(config.get('template'))
+
+    async def get_vm_ostype(self, node: str, vmid: int) -> str:
+        try:
+            config = await self.get_vm_config(node, vmid)
+            return config.get('ostype', 'other')
+        except Exception:
+            return 'other'
+
+    async def get_vm_ip(self, node: str, vmid: int):
+        return await self.ip_resolver.resolve(node, vmid)
+
+    async def _fetch_vm_ip(self, node: str, vmid: int):
+        try:
+            data = await self._request(
+                "POST", f"/nodes/{node}/qemu/{vmid}/agent/network-get-interfaces",
+                timeout=settings.PVE_AGENT_TIMEOUT, health=False,
+            )
+        except Exception:
+            return None
+        return parse_agent_ip(data)
+
+    async def clone_vm(self, node: str, vmid: int, newid: int, name: str, target_node: str = None, full: bool = False):
+        params = {
+            'newid': newid,
+            'name': name,
+            'full': int(full)
+        }
+        if target_node:
+            params['target'] = target_node
+        try:
+            return await self._post(f"/nodes/{node}/qemu/{vmid}/clone", **params)
+        finally:
+            self.invalidate_vm(newid)
+
+    async def start_vm(self, node: str, vmid: int):
+        return await self._post(f"/nodes/{node}/qemu/{vmid}/status/start")
+
+    async def stop_vm(self, node: str, vmid: int):
+        return await self._post(f"/nodes/{node}/qemu/{vmid}/status/stop")
+
+    async def shutdown_vm(self, node: str, vmid: int):
+        return await self._post(f"/nodes/{node}/qemu/{vmid}/status/shutdown")
+
+    async def reset_vm(self, node: str, vmid: int):
+        return await self._post(f"/nodes/{node}/qemu/{vmid}/status/reset")
+
+    async def start_all(self, node: str, vmids):
+        # Node-level bulk start: one task on the node for all listed guests.
+        # force=1 also starts guests without onboot set.
+        return await self._post(
+            f"/nodes/{node}/startall", vms=",".join(str(v) for v in vmids), force=1
+        )
+
+    async def delete_vm(self, node: str, vmid: int):
+        try:
+            return await self._request("DELETE", f"/nodes/{node}/qemu/{vmid}")
+        finally:
+            self.invalidate_vm(vmid)
+
+    async def get_vnc_ticket(self, node: str, vmid: int):
+        # generate-password=1 is crucial for noVNC
+        return await self._post(f"/nodes/{node}/qemu/{vmid}/vncproxy", websocket=1, **{'generate-password': 1})
+
+    async def get_next_vmid(self):
+        return await self._get("/cluster/nextid")
+
+    @shared_read
+    async def get_task_status(self, node: str, upid: str):
+        return await self._get(f"/nodes/{node}/tasks/{upid}/status")
+
+    @shared_read
+    async def get_node_tasks(self, node: str, **params):
+        return await self._get(f"/nodes/{node}/tasks", **params)
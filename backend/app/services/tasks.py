@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select
+from app.core import database
+from app.core.config import settings
+from app.models import task as task_model
+from app.schemas import task as task_schema
+from app.services.clusters import pve_clusters
+
+logger = logging.getLogger(__name__)
+
+# exitstatus of a task whose status could not be read within PVE_TASK_TIMEOUT
+UNKNOWN_STATUS = "unknown"
+
+
+def parse_upid(upid: str):
+    """
+    Split a PVE UPID (UPID:node:pid:pstart:starttime:type:id:user:) into its parts.
+    """
+    parts = upid.split(':')
+    if len(parts) < 8 or parts[0] != 'UPID':
+        raise ValueError(f"Invalid UPID: {upid}")
+    return {
+        "node": parts[1],
+        "starttime": int(parts[4], 16),
+        "type": parts[5],
+        "id": parts[6],
+        "user": parts[7],
+    }
+
+
+class TaskTracker:
+    """
+    Records PVE task UPIDs in the DB and watches them until they finish.
+
+    Pending tasks are polled in one /nodes/{node}/tasks listing per cluster,
+    node and tick instead of one status call per task. Finished tasks resolve waiters
+    (see wait()) and are pushed to stream subscribers.
+    """
+
+    def __init__(self):
+        self._pending = {}  # upid -> (cluster, node, starttime)
+        self._waiters = defaultdict(list)  # upid -> [Future]
+        self._subscribers = set()
+        self._task = None
+        self._wakeup = None
+
+    # --- Registration ---
+
+    async def register(self, upid: str, cluster: str = None, vmid: int = None, user_id: int = None, db=None):
+        await self.register_many([(upid, cluster, vmid)], user_id=user_id, db=db)
+
+    async def register_many(self, items, user_id: int = None, db=None):
+        """
+        Record (upid, cluster, vmid) tuples returned by PVE calls; a None
+        cluster is the default one. Opens its own session if none is given.
+        """
+        tasks = {}
+        for upid, cluster, vmid in items:
+            if not isinstance(upid, str) or upid in tasks:
+                continue
+            try:
+                info = parse_upid(upid)
+            except ValueError:
+                continue
+            cluster = cluster or pve_clusters.default
+            tasks[upid] = task_model.Task(
+                upid=upid,
+                cluster=cluster,
+                node=info['node'],
+                vmid=vmid,
+                type=info['type'],
+                status="running",
+                user_id=user_id,
+            )
+            self._pending[upid] = (cluster, info['node'], info['starttime'])
+        if not tasks:
+            return
+
+        own_session = db is None
+        db = db or database.SessionLocal()
+        try:
+            db.add_all(tasks.values())
+            await db.commit()
+        finally:
+            if own_session:
+                await db.close()
+        for event in [self._event(task) for task in tasks.values()]:
+            self._publish(event)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- Waiting and streaming ---
+
+    async def wait(self, upid: str, timeout: float = None):
+        """
+        Wait until a registered task stops and return its exitstatus.
+        """
+        if upid not in self._pending:
+            async with database.SessionLocal() as db:
+                result = await db.execute(select(task_model.Task).where(task_model.Task.upid == upid))
+                task = result.scalars().first()
+            if task is None or task.status == "stopped":
+                return task.exitstatus if task else None
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[upid].append(future)
+        try:
+            return await asyncio.wait_for(future, timeout or settings.PVE_TASK_TIMEOUT)
+        finally:
+            # Timed out or cancelled: do not keep the future until the task ends
+            waiters = self._waiters.get(upid)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[upid]
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=100)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def _event(self, task):
+        return task_schema.Task.model_validate(task).model_dump(mode="json")
+
+    def _publish(self, event):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop the event rather than block the tracker
+                pass
+
+    # --- Polling ---
+
+    async def _poll_node(self, cluster: str, node: str, upids):
+        """
+        Return {upid: exitstatus} for the given tasks of `node` that have finished.
+        """
+        api = pve_clusters.get(cluster).api
+        since = min(self._pending[upid][2] for upid in upids)
+        listing = await api.get_node_tasks(
+            node, source='all', since=since, limit=settings.PVE_TASK_LIST_LIMIT
+        )
+        by_upid = {entry.get('upid'): entry for entry in listing or []}
+
+        finished = {}
+        for upid in upids:
+            entry = by_upid.get(upid)
+            if entry is not None:
+                if entry.get('endtime'):
+                    finished[upid] = entry.get('status')
+                continue
+            # Not in the listing window (very busy node): ask for this task directly
+            try:
+                status = await api.get_task_status(node, upid)
+                if status.get('status') == 'stopped':
+                    finished[upid] = status.get('exitstatus')
+            except Exception:
+                if time.time() - self._pending[upid][2] > settings.PVE_TASK_TIMEOUT:
+                    finished[upid] = UNKNOWN_STATUS
+        return finished
+
+    async def poll_once(self):
+        by_node = defaultdict(list)
+        for upid, (cluster, node, _) in list(self._pending.items()):
+            by_node[(cluster, node)].append(upid)
+        if not by_node:
+            return
+
+        results = await asyncio.gather(
+            *(self._poll_node(cluster, node, upids) for (cluster, node), upids in by_node.items()),
+            return_exceptions=True,
+        )
+        finished = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Task poll failed: %s", result)
+                continue
+            finished.update(result)
+        if finished:
+            await self._complete(finished)
+            for upid, exitstatus in finished.items():
+                self._pending.pop(upid, None)
+                for future in self._waiters.pop(upid, []):
+                    if not future.done():
+                        future.set_result(exitstatus)
+
+    async def _complete(self, finished):
+        async with database.SessionLocal() as db:
+            result = await db.execute(select(task_model.Task).where(task_model.Task.upid.in_(list(finished))))
+            tasks = result.scalars().all()
+            now = datetime.utcnow()
+            for task in tasks:
+                task.status = "stopped"
+                task.exitstatus = finished[task.upid]
+                task.finished_at = now
+            await db.commit()
+        for task in tasks:
+            self._publish(self._event(task))
+
+    async def _load_pending(self):
+        async with database.SessionLocal() as db:
+            result = await db.execute(select(task_model.Task).where(task_model.Task.status == "running"))
+            for task in result.scalars():
+                try:
+                    self._pending[task.upid] = (
+                        task.cluster or pve_clusters.default, task.node, parse_upid(task.upid)['starttime']
+                    )
+                except ValueError:
+                    continue
+
+    async def _run(self):
+        await self._load_pending()
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Task tracker error")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.PVE_TASK_POLL_INTERVAL)
+                # New task registered: give PVE a moment before the first poll
+                await asyncio.sleep(min(1, settings.PVE_TASK_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
+
+
+task_tracker = TaskTracker()
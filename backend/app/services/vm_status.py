@@ -0,0 +1,116 @@
+import asyncio
+
+# Fields pushed to subscribers; everything else stays behind /vms/
+PUSHED_FIELDS = ('status', 'uptime', 'ip', 'cpu', 'mem', 'name', 'cluster', 'node', 'template')
+
+
+def vm_key(cluster: str, vmid: int) -> str:
+    """
+    Key of a VM in status messages: "<cluster>/<vmid>" (VMIDs repeat across clusters).
+    """
+    return f"{cluster}/{vmid}"
+
+
+# Queued to user subscriptions whose VMs changed: the socket reloads its keys
+RELOAD = {"type": "reload"}
+
+
+def _vm_state(vm):
+    state = {field: vm.get(field) for field in PUSHED_FIELDS}
+    # cpu is a 0-1 float that jitters every refresh; round it to limit noise
+    if state['cpu'] is not None:
+        state['cpu'] = round(state['cpu'], 3)
+    state['template'] = bool(state['template'])
+    return state
+
+
+class Subscription:
+    def __init__(self, keys=None):
+        # vm_key()s; None = every VM (admins)
+        self.keys = set(keys) if keys is not None else None
+        self.queue = asyncio.Queue(maxsize=10)
+
+    def visible(self, key: str) -> bool:
+        return self.keys is None or key in self.keys
+
+    def filter(self, vms: dict) -> dict:
+        if self.keys is None:
+            return vms
+        return {key: state for key, state in vms.items() if key in self.keys}
+
+
+class VMStatusHub:
+    """
+    Turns the inventory poller's snapshots into per-VM diffs and fans them out
+    to WebSocket subscribers, each scoped to the VMs it may see.
+    """
+
+    def __init__(self):
+        self.current = {}  # vm_key -> pushed state
+        self._subscriptions = set()
+
+    def subscribe(self, keys=None) -> Subscription:
+        subscription = Subscription(keys)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def reload_owners(self):
+        """
+        VMs were created, assigned or deleted: have every user subscription
+        reload the VMs it may see and start over from a snapshot.
+        """
+        for subscription in list(self._subscriptions):
+            if subscription.keys is None:
+                continue
+            # Diffs still queued are superseded by the snapshot after the reload
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(RELOAD)
+
+    def snapshot(self, subscription: Subscription) -> dict:
+        return {"type": "snapshot", "vms": subscription.filter(self.current)}
+
+    def publish(self, vms):
+        """
+        Diff a fresh inventory against the last one and push the changes.
+        Must be called from the event loop.
+        """
+        new = {
+            vm_key(vm.get('cluster'), int(vm['vmid'])): _vm_state(vm)
+            for vm in vms if str(vm.get('vmid')).isdigit()
+        }
+        changed = {}
+        for key, state in new.items():
+            old = self.current.get(key)
+            if old is None:
+                changed[key] = state
+                continue
+            delta = {field: value for field, value in state.items() if old.get(field) != value}
+            if delta:
+                changed[key] = delta
+        removed = [key for key in self.current if key not in new]
+        self.current = new
+
+        if not changed and not removed:
+            return
+        for subscription in list(self._subscriptions):
+            message = {
+                "type": "diff",
+                "changed": subscription.filter(changed),
+                "removed": [key for key in removed if subscription.visible(key)],
+            }
+            if not message["changed"] and not message["removed"]:
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Client is too far behind for diffs to be useful: resync it
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(self.snapshot(subscription))
+
+
+vm_status_hub = VMStatusHub()
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from collections import defaultdict
+from app.core.config import settings
+from app.services.clusters import pve_clusters
+
+
+class VMIDAllocator:
+    """
+    Hands out VMIDs for new clones without races between concurrent requests.
+
+    PVE's /cluster/nextid only reports the lowest free ID and reserves nothing,
+    so two clones started at the same time could get the same ID. Allocations
+    here are serialized and the IDs stay reserved (for VMID_RESERVATION_TTL
+    seconds, or until released) while PVE creates the VMs.
+    Reservations are per process and per cluster, as VMIDs are.
+    """
+
+    def __init__(self):
+        self._locks = defaultdict(asyncio.Lock)  # cluster -> Lock
+        self._reserved = defaultdict(dict)  # cluster -> {vmid: expires_at}
+
+    def _expire(self, reserved: dict):
+        now = time.monotonic()
+        for vmid in [v for v, expires_at in reserved.items() if expires_at <= now]:
+            del reserved[vmid]
+
+    async def allocate(self, cluster: str, count: int = 1, exclude=()):
+        """
+        Reserve `count` consecutive free VMIDs in `cluster` and return them.
+        `exclude` lists IDs known to be taken outside PVE (e.g. DB records).
+        """
+        async with self._locks[cluster]:
+            reserved = self._reserved[cluster]
+            self._expire(reserved)
+            api = pve_clusters.get(cluster).api
+            start = int(await api.get_next_vmid())
+            used = {int(vm['vmid']) for vm in await api.get_vm_resources()}
+            used |= set(reserved)
+            used |= {int(v) for v in exclude}
+
+            vmids = []
+            vmid = start
+            while len(vmids) < count:
+                if vmid in used:
+                    vmids = []
+                else:
+                    vmids.append(vmid)
+                vmid += 1
+
+            expires_at = time.monotonic() + settings.VMID_RESERVATION_TTL
+            for vmid in vmids:
+                reserved[vmid] = expires_at
+            return vmids
+
+    def release(self, cluster: str, vmids):
+        for vmid in vmids:
+            self._reserved[cluster].pop(int(vmid), None)
+
+
+vmid_allocator = VMIDAllocator()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import secrets
+import time
+from app.core.config import settings
+from app.core.metrics import Gauge
+from app.services.clusters import pve_clusters
+from app.services.vnc_relay import connect_pve_console
+
+logger = logging.getLogger(__name__)
+
+
+class VNCTicketPool:
+    """
+    vncproxy tickets fetched ahead of a likely console open (e.g. when the
+    pointer rests on a desktop). PVE only waits a few seconds for a ticket to
+    be used, so entries live for VNC_PREFETCH_TTL and each is used once.
+    """
+
+    def __init__(self):
+        self._tickets = {}  # (cluster, node, vmid) -> (expires_at, ticket)
+        self._inflight = {}  # (cluster, node, vmid) -> Task
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._tickets.items() if expires_at <= now]:
+            del self._tickets[key]
+
+    def prefetch(self, cluster: str, node: str, vmid: int):
+        if settings.VNC_PREFETCH_TTL <= 0:
+            return
+        key = (cluster, node, int(vmid))
+        self._prune()
+        if key in self._tickets or key in self._inflight:
+            return
+        self._inflight[key] = asyncio.create_task(self._fetch(key))
+
+    async def _fetch(self, key):
+        try:
+            cluster, node, vmid = key
+            ticket = await pve_clusters.get(cluster).api.get_vnc_ticket(node, vmid)
+            self._tickets[key] = (time.monotonic() + settings.VNC_PREFETCH_TTL, ticket)
+        except Exception as e:
+            logger.warning("VNC ticket prefetch failed for %s: %s", key, e)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def take(self, cluster: str, node: str, vmid: int):
+        """
+        Return a fresh prefetched ticket (waiting for one already on the way),
+        or None.
+        """
+        key = (cluster, node, int(vmid))
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            await asyncio.shield(inflight)
+        entry = self._tickets.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def get(self, cluster: str, node: str, vmid: int):
+        return (
+            await self.take(cluster, node, vmid)
+            or await pve_clusters.get(cluster).api.get_vnc_ticket(node, vmid)
+        )
+
+
+class ConsoleParking:
+    """
+    Upstream PVE console sockets opened by /vnc-connect before the browser
+    connects, keyed by a one-time token. The PVE TLS/WebSocket handshake then
+    overlaps with the browser loading noVNC and opening its own socket.
+    Unclaimed sockets are closed after VNC_CONNECT_TTL.
+    """
+
+    def __init__(self):
+        self._parked = {}  # token -> (node, vmid, Task[pve_ws])
+
+    def park(self, cluster: str, node: str, vmid: int, ticket) -> str:
+        token = secrets.token_urlsafe(24)
+        pve_cluster = pve_clusters.get(cluster)
+        task = asyncio.create_task(connect_pve_console(
+            pve_cluster.config, node, vmid, ticket['port'], ticket['ticket'], host=pve_cluster.console_host(node)
+        ))
+        # Failures are reported to whoever claims the socket; don't warn if nobody does
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._parked[token] = (node, int(vmid), task)
+        asyncio.get_running_loop().call_later(settings.VNC_CONNECT_TTL, self._expire, token)
+        return token
+
+    def take(self, token: str, node: str, vmid: int):
+        """
+        Claim a parked connection (once). Returns a task resolving to the PVE
+        socket, or None if the token is unknown, expired or for another VM.
+        """
+        entry = self._parked.pop(token, None)
+        if entry is None:
+            return None
+        if entry[:2] != (node, int(vmid)):
+            self._discard(entry[2])
+            return None
+        return entry[2]
+
+    def _expire(self, token: str):
+        entry = self._parked.pop(token, None)
+        if entry is not None:
+            self._discard(entry[2])
+
+    def _discard(self, task):
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            asyncio.create_task(task.result().close())
+
+    def __len__(self):
+        return len(self._parked)
+
+
+vnc_ticket_pool = VNCTicketPool()
+console_parking = ConsoleParking()
+
+Gauge(
+    "vnc_parked_connections",
+    "Upstream console sockets waiting for their browser",
+    function=lambda: len(console_parking),
+)
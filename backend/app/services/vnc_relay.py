@@ -0,0 +1,344 @@
+import asyncio
+import itertools
+import logging
+import ssl
+import time
+import urllib.parse
+from dataclasses import dataclass
+import websockets
+from starlette.websockets import WebSocketDisconnect
+from websockets.exceptions import ConnectionClosed
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from app.core.config import PVEClusterConfig, settings
+from app.core.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+UP = "up"  # browser -> PVE
+DOWN = "down"  # PVE -> browser
+
+# Marks "no frame read ahead" while coalescing (None is the end-of-stream marker)
+_NOTHING = object()
+
+
+def _flag(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _clamp(value, default: int, low: int, high: int) -> int:
+    try:
+        return min(max(int(value), low), high)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class VNCSessionOptions:
+    """
+    Per-connection WAN options, read from the console URL query string:
+
+    - compress=1: permessage-deflate towards the browser; level (0-9) and
+      window (9-15 bits) override VNC_DEFLATE_LEVEL / VNC_DEFLATE_WINDOW_BITS
+    - coalesce=1: merge small PVE -> browser frames arriving within
+      VNC_COALESCE_MS into one WebSocket message (fewer sends and headers)
+
+    Both are off unless asked for, so sessions can be A/B tested.
+    """
+
+    compress: bool = False
+    level: int = 6
+    window_bits: int = 12
+    mem_level: int = 5
+    coalesce_ms: int = 0
+    coalesce_max_bytes: int = 65536
+
+    @classmethod
+    def from_query(cls, params) -> "VNCSessionOptions":
+        return cls(
+            compress=_flag(params.get("compress")),
+            level=_clamp(params.get("level"), settings.VNC_DEFLATE_LEVEL, 0, 9),
+            window_bits=_clamp(params.get("window"), settings.VNC_DEFLATE_WINDOW_BITS, 9, 15),
+            mem_level=_clamp(settings.VNC_DEFLATE_MEM_LEVEL, 5, 1, 9),
+            coalesce_ms=settings.VNC_COALESCE_MS if _flag(params.get("coalesce")) else 0,
+            coalesce_max_bytes=settings.VNC_COALESCE_MAX_BYTES,
+        )
+
+    def deflate_factory(self):
+        """
+        Extension factory for the browser-facing handshake, or None when off.
+        """
+        if not self.compress:
+            return None
+        return ServerPerMessageDeflateFactory(
+            server_max_window_bits=self.window_bits,
+            compress_settings={"level": self.level, "memLevel": self.mem_level},
+        )
+
+
+# SSL contexts for PVE connections, by the cluster's verify_ssl
+_pve_ssl_contexts = {}
+
+
+def pve_ssl_context(verify: bool) -> ssl.SSLContext:
+    context = _pve_ssl_contexts.get(verify)
+    if context is None:
+        context = ssl.create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _pve_ssl_contexts[verify] = context
+    return context
+
+
+async def connect_pve_console(cluster: PVEClusterConfig, node: str, vmid: int, port, ticket: str, host=None):
+    """
+    Open the vncwebsocket of a VM on PVE using a ticket from vncproxy.
+    `host` is an optional (host, port) to connect to instead of the cluster's
+    configured one, e.g. the VM's own node.
+    """
+    host, api_port = host or (cluster.host, cluster.port)
+    clean_ticket = urllib.parse.quote(ticket, safe='')
+    headers = {
+        "Authorization": f"PVEAPIToken={cluster.user}!{cluster.token_name}={cluster.token_value}",
+        "Origin": f"https://{host}:{api_port}",
+    }
+    pve_ws_url = (
+        f"wss://{host}:{api_port}/api2/json/nodes/{node}/qemu/{vmid}/vncwebsocket?"
+        f"port={port}&vncticket={clean_ticket}"
+    )
+    return await websockets.connect(
+        pve_ws_url,
+        ssl=pve_ssl_context(cluster.verify_ssl),
+        subprotocols=['binary'],
+        additional_headers=headers
+    )
+
+
+class StarletteEndpoint:
+    """
+    Browser side of a relay (FastAPI/Starlette WebSocket).
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+
+    async def recv(self):
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return message.get("text")
+
+    async def send(self, data):
+        # Frames keep their type: no re-encoding of text frames
+        if isinstance(data, str):
+            await self.websocket.send_text(data)
+        else:
+            await self.websocket.send_bytes(data)
+
+    async def close(self, code: int = 1000):
+        try:
+            await self.websocket.close(code)
+        except (RuntimeError, WebSocketDisconnect):
+            # Already closed, or the browser went away first
+            pass
+
+
+class WebsocketsEndpoint:
+    """
+    A connection from the `websockets` library (the PVE vncwebsocket side).
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def recv(self):
+        try:
+            return await self.connection.recv()
+        except ConnectionClosed:
+            return None
+
+    async def send(self, data):
+        await self.connection.send(data)
+
+    async def close(self, code: int = 1000):
+        await self.connection.close(code)
+
+
+class RelayStats:
+    """
+    Per-session counters: bytes/frames per direction and the time a frame
+    spends in the relay (received on one side -> sent on the other).
+    """
+
+    def __init__(self, session_id: int, node: str, vmid: int, options: VNCSessionOptions):
+        self.session_id = session_id
+        self.node = node
+        self.vmid = vmid
+        self.options = options
+        self.started_at = time.time()
+        self.bytes = {UP: 0, DOWN: 0}
+        self.frames = {UP: 0, DOWN: 0}
+        self._latency_total = {UP: 0.0, DOWN: 0.0}
+        self._latency_max = {UP: 0.0, DOWN: 0.0}
+
+    def record(self, direction: str, size: int, latency: float):
+        self.bytes[direction] += size
+        self.frames[direction] += 1
+        self._latency_total[direction] += latency
+        relay_bytes.inc(size, direction=direction)
+        if latency > self._latency_max[direction]:
+            self._latency_max[direction] = latency
+
+    def snapshot(self):
+        duration = max(time.time() - self.started_at, 1e-6)
+        result = {
+            "session_id": self.session_id,
+            "node": self.node,
+            "vmid": self.vmid,
+            "duration": round(duration, 1),
+            "compress": self.options.compress,
+            "coalesce_ms": self.options.coalesce_ms,
+        }
+        for direction in (UP, DOWN):
+            frames = self.frames[direction]
+            result[direction] = {
+                "bytes": self.bytes[direction],
+                "frames": frames,
+                "bytes_per_sec": round(self.bytes[direction] / duration, 1),
+                "avg_latency_ms": round(self._latency_total[direction] / frames * 1000, 3) if frames else 0.0,
+                "max_latency_ms": round(self._latency_max[direction] * 1000, 3),
+            }
+        return result
+
+
+# Active relay sessions, session_id -> RelayStats
+sessions = {}
+_session_ids = itertools.count(1)
+
+relay_bytes = Counter("vnc_relay_bytes_total", "Bytes relayed by VNC sessions", ("direction",))
+relay_sessions = Counter("vnc_relay_sessions_total", "VNC relay sessions started")
+Gauge("vnc_active_sessions", "VNC relay sessions open in this process", function=lambda: len(sessions))
+
+
+class VNCRelay:
+    """
+    Bidirectional WebSocket pump between the browser and PVE.
+
+    Each direction has a reader and a writer joined by a bounded queue. When
+    the writer falls behind (slow browser or link), the queue fills up, the
+    reader stops reading and TCP flow control pushes back on the sender
+    instead of the server buffering without limit.
+    When either side closes, frames already queued for the other side are
+    flushed and then both sides are closed.
+    """
+
+    def __init__(self, client, upstream, node: str, vmid: int, options: VNCSessionOptions = None):
+        self.client = client
+        self.upstream = upstream
+        self.options = options or VNCSessionOptions()
+        self.stats = RelayStats(next(_session_ids), node, vmid, self.options)
+
+    async def _read(self, source, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await source.recv()
+                if message is None:
+                    break
+                # Blocks while the queue is full: this is the backpressure
+                await queue.put((time.monotonic(), message))
+        except Exception as e:
+            logger.warning("VNC relay %s read error: %r", self.stats.session_id, e)
+        # End of stream: the writer flushes what is queued, then stops
+        await queue.put(None)
+
+    async def _coalesce(self, queue: asyncio.Queue, first: bytes):
+        """
+        Join binary frames that arrive within the coalesce window after `first`.
+
+        noVNC reads the socket as one RFB byte stream, so message boundaries
+        carry no meaning and consecutive binary frames can be concatenated.
+        Returns the joined data and the item read ahead that could not be
+        merged (a text frame or end of stream), or _NOTHING.
+        """
+        chunks = [first]
+        size = len(first)
+        deadline = time.monotonic() + self.options.coalesce_ms / 1000
+        while size < self.options.coalesce_max_bytes:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is None or not isinstance(item[1], bytes):
+                return b"".join(chunks), item
+            chunks.append(item[1])
+            size += len(item[1])
+        return b"".join(chunks), _NOTHING
+
+    async def _write(self, sink, queue: asyncio.Queue, direction: str, coalesce: bool = False):
+        ahead = _NOTHING
+        while True:
+            if ahead is _NOTHING:
+                item = await queue.get()
+            else:
+                item, ahead = ahead, _NOTHING
+            if item is None:
+                return
+            received_at, message = item
+            if coalesce and isinstance(message, bytes):
+                message, ahead = await self._coalesce(queue, message)
+            await sink.send(message)
+            self.stats.record(direction, len(message), time.monotonic() - received_at)
+
+    async def run(self):
+        up_queue = asyncio.Queue(maxsize=settings.VNC_RELAY_QUEUE_SIZE)
+        down_queue = asyncio.Queue(maxsize=settings.VNC_RELAY_QUEUE_SIZE)
+        readers = [
+            asyncio.create_task(self._read(self.client, up_queue)),
+            asyncio.create_task(self._read(self.upstream, down_queue)),
+        ]
+        writers = [
+            asyncio.create_task(self._write(self.upstream, up_queue, UP)),
+            asyncio.create_task(
+                self._write(self.client, down_queue, DOWN, coalesce=self.options.coalesce_ms > 0)
+            ),
+        ]
+        sessions[self.stats.session_id] = self.stats
+        relay_sessions.inc()
+        try:
+            # A writer finishes once its source closed and its queue is drained,
+            # or when sending fails; either way the session is over.
+            done, _ = await asyncio.wait(writers, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is not None and not isinstance(error, (ConnectionClosed, WebSocketDisconnect)):
+                    logger.warning("VNC relay %s error: %r", self.stats.session_id, error)
+        finally:
+            sessions.pop(self.stats.session_id, None)
+            for task in readers + writers:
+                task.cancel()
+            await asyncio.gather(*readers, *writers, return_exceptions=True)
+            await self.client.close()
+            await self.upstream.close()
+
+
+def relay_summary():
+    """
+    Active sessions plus totals, for sizing how many desktops a worker carries.
+    """
+    active = [stats.snapshot() for stats in list(sessions.values())]
+    return {
+        "active_sessions": len(active),
+        "total_bytes_per_sec": {
+            direction: round(sum(s[direction]["bytes_per_sec"] for s in active), 1)
+            for direction in (UP, DOWN)
+        },
+        "sessions": active,
+    }
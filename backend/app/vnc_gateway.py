@@ -0,0 +1,143 @@
+"""
+Standalone VNC console gateway.
+
+Serves only /ws/vncproxy/{node}/{vmid}?token=..., so console traffic runs in
+its own processes instead of sharing the API event loop. Every worker binds
+the same port with SO_REUSEPORT and the kernel spreads new connections across
+them. Tokens come from GET /api/v1/vms/{vmid}/vnc-ticket; set VNC_GATEWAY_URL
+so the web UI connects here.
+
+    python -m app.vnc_gateway --workers 4 --port 8001
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import signal
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+from jose import JWTError
+from websockets.asyncio.server import serve
+from app.core.config import settings
+from app.core.security import decode_vnc_token
+from app.services.vnc_relay import VNCRelay, VNCSessionOptions, WebsocketsEndpoint, connect_pve_console
+
+logger = logging.getLogger(__name__)
+
+CONSOLE_PATH = re.compile(r"/ws/vncproxy/(?P<node>[^/]+)/(?P<vmid>\d+)$")
+
+
+def process_request(connection, request):
+    """
+    Check the token before the handshake completes and pick the extensions
+    for this connection. Returning a response rejects the connection.
+    """
+    url = urlsplit(request.path)
+    if url.path == "/health":
+        return connection.respond(HTTPStatus.OK, "ok\n")
+    match = CONSOLE_PATH.search(url.path)
+    if match is None:
+        return connection.respond(HTTPStatus.NOT_FOUND, "Not Found\n")
+
+    params = dict(parse_qsl(url.query))
+    try:
+        claims = decode_vnc_token(params.get("token", ""))
+    except JWTError:
+        return connection.respond(HTTPStatus.UNAUTHORIZED, "Invalid or expired token\n")
+    if claims["node"] != match["node"] or claims["vmid"] != int(match["vmid"]):
+        return connection.respond(HTTPStatus.FORBIDDEN, "Token was issued for another VM\n")
+
+    options = VNCSessionOptions.from_query(params)
+    factory = options.deflate_factory()
+    connection.protocol.available_extensions = [factory] if factory else []
+    connection.console = (claims, options)
+    return None
+
+
+def select_subprotocol(connection, subprotocols):
+    # Older noVNC asks for "binary", newer sends no subprotocol at all
+    return "binary" if "binary" in subprotocols else None
+
+
+async def handler(connection):
+    claims, options = connection.console
+    pve_ws = None
+    try:
+        # Tokens from before clusters carry no cluster name: the default one
+        cluster = settings.pve_cluster_config(claims.get("cluster"))
+        host = tuple(claims["host"]) if claims.get("host") else None
+        pve_ws = await connect_pve_console(
+            cluster, claims["node"], claims["vmid"], claims["port"], claims["ticket"], host=host
+        )
+        relay = VNCRelay(
+            WebsocketsEndpoint(connection), WebsocketsEndpoint(pve_ws),
+            node=claims["node"], vmid=claims["vmid"], options=options,
+        )
+        await relay.run()
+    except Exception as e:
+        logger.warning("VNC gateway session for VM %s on %s failed: %s", claims["vmid"], claims["node"], e)
+        await connection.close(1011)
+    finally:
+        if pve_ws:
+            await pve_ws.close()
+
+
+async def serve_forever(host: str, port: int):
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+
+    async with serve(
+        handler,
+        host,
+        port,
+        process_request=process_request,
+        select_subprotocol=select_subprotocol,
+        # Negotiated per connection in process_request
+        compression=None,
+        reuse_port=True,
+    ):
+        logger.info("VNC gateway worker %s listening on %s:%s", os.getpid(), host, port)
+        await stop
+
+
+def run_worker(host: str, port: int):
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(serve_forever(host, port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standalone VNC console gateway")
+    parser.add_argument("--host", default=settings.VNC_GATEWAY_HOST)
+    parser.add_argument("--port", type=int, default=settings.VNC_GATEWAY_PORT)
+    parser.add_argument("--workers", type=int, default=settings.VNC_GATEWAY_WORKERS)
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    if workers == 1:
+        run_worker(args.host, args.port)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.host, args.port), name=f"vnc-gateway-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+Simulated Proxmox VE API for benchmarks and local development.
+
+Serves the part of /api2/json the backend uses (cluster, nodes, qemu status,
+config, guest agent, clone, power actions, tasks, vncproxy and the
+vncwebsocket console) over HTTPS with a self-signed certificate, for a
+synthetic cluster of any size. Every API call can be delayed and made to fail
+at random, to see how the backend behaves with a slow or flaky PVE.
+
+Run standalone and point the backend at it (PVE_HOST=127.0.0.1,
+PVE_PORT=8006, PVE_VERIFY_SSL=false, any PVE_TOKEN_*):
+
+    python -m bench.fake_pve --nodes 4 --vms 2000 --latency-ms 20
+
+or start it in-process with FakePVEServer (see bench.run).
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import secrets
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+import uvicorn
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+OSTYPES = ["win10", "win11", "l26", "win10", "l26"]
+GiB = 1024 ** 3
+# Templates live on the shared storage (clonable to any node), desktops on node-local LVM
+SHARED_STORAGE = "ceph-vm"
+LOCAL_STORAGE = "local-lvm"
+
+
+@dataclass
+class FakePVEConfig:
+    nodes: int = 4
+    vms: int = 2000
+    templates: int = 4
+    # Added to every API call: latency_ms +/- jitter_ms
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    # Fraction of API calls answered with HTTP 500
+    failure_rate: float = 0.0
+    # Guest agent calls: extra delay, and fraction of VMs without an agent
+    agent_latency_ms: float = 0
+    agent_missing_rate: float = 0.1
+    # Seconds until a task (clone, start, ...) finishes, and fraction that fail
+    task_seconds: float = 1.0
+    task_failure_rate: float = 0.0
+    # Console: bytes per frame streamed to the client, 0 = only the RFB banner
+    vnc_frame_size: int = 16384
+    # Fraction of the cluster running
+    running_rate: float = 0.7
+
+
+class FakeCluster:
+    """
+    In-memory cluster state: nodes, VMs, tasks and console tickets.
+    """
+
+    def __init__(self, config: FakePVEConfig, seed: int = 1):
+        self.config = config
+        self.random = random.Random(seed)
+        self.nodes = [f"pve{i + 1}" for i in range(config.nodes)]
+        self.vms = {}  # vmid -> dict (resource fields + "config")
+        self.tasks = {}  # upid -> dict
+        self.tickets = {}  # vncticket -> (node, vmid, port)
+        self.api_calls = 0  # API requests served, for calls-per-request figures
+        # Random start so several simulated clusters do not hand out equal UPIDs
+        self._pids = itertools.count(random.randrange(1000, 4000000))
+        self._ports = itertools.count(5900)
+        self._build()
+
+    def _build(self):
+        for i in range(self.config.templates):
+            vmid = 9000 + i
+            self._add_vm(vmid, self.nodes[i % len(self.nodes)], f"tpl-{OSTYPES[i % len(OSTYPES)]}-{i}", template=True)
+        for i in range(self.config.vms):
+            vmid = 100 + i
+            running = self.random.random() < self.config.running_rate
+            self._add_vm(vmid, self.nodes[i % len(self.nodes)], f"desktop-{vmid}", running=running)
+
+    def _add_vm(self, vmid: int, node: str, name: str, template: bool = False, running: bool = False,
+                ostype: str = None, storage: str = None):
+        ostype = ostype or OSTYPES[vmid % len(OSTYPES)]
+        storage = storage or (SHARED_STORAGE if template else LOCAL_STORAGE)
+        self.vms[vmid] = {
+            "vmid": vmid,
+            "name": name,
+            "node": node,
+            "type": "qemu",
+            "id": f"qemu/{vmid}",
+            "status": "running" if running else "stopped",
+            "template": 1 if template else 0,
+            "maxcpu": 4,
+            "maxmem": 8 * GiB,
+            "maxdisk": 64 * GiB,
+            "disk": 0,
+            "config": {
+                "name": name,
+                "ostype": ostype,
+                "cores": 4,
+                "memory": 8192,
+                "agent": "1",
+                "template": 1 if template else 0,
+                "scsi0": f"{storage}:{'base' if template else 'vm'}-{vmid}-disk-0,size=64G",
+            },
+            "started": time.time() if running else None,
+        }
+
+    def get_vm(self, node: str, vmid: int):
+        vm = self.vms.get(vmid)
+        if vm is None or vm["node"] != node:
+            raise HTTPException(status_code=500, detail=f"Configuration file 'qemu-server/{vmid}.conf' does not exist")
+        return vm
+
+    def resource(self, vm):
+        result = {k: v for k, v in vm.items() if k not in ("config", "started")}
+        running = vm["status"] == "running"
+        result["uptime"] = int(time.time() - vm["started"]) if running else 0
+        result["cpu"] = round(self.random.random() * 0.3, 4) if running else 0
+        result["mem"] = int(vm["maxmem"] * 0.4) if running else 0
+        return result
+
+    def node_info(self, node: str):
+        vms = [vm for vm in self.vms.values() if vm["node"] == node]
+        running = [vm for vm in vms if vm["status"] == "running"]
+        maxcpu, maxmem = 64, 512 * GiB
+        return {
+            "node": node,
+            "id": f"node/{node}",
+            "type": "node",
+            "status": "online",
+            "cpu": round(min(len(running) * 0.002, 1.0), 4),
+            "maxcpu": maxcpu,
+            "mem": min(sum(int(vm["maxmem"] * 0.4) for vm in running), maxmem),
+            "maxmem": maxmem,
+            "disk": 20 * GiB,
+            "maxdisk": 100 * GiB,
+            "uptime": 86400,
+        }
+
+    @staticmethod
+    def vm_storage(vm) -> str:
+        return vm["config"]["scsi0"].split(":", 1)[0]
+
+    def storage_info(self, node: str):
+        """
+        The node's local LVM and its view of the shared storage.
+        """
+        def used(vms):
+            return sum(vm["maxdisk"] // 8 for vm in vms)
+
+        local = [vm for vm in self.vms.values() if vm["node"] == node and self.vm_storage(vm) == LOCAL_STORAGE]
+        shared = [vm for vm in self.vms.values() if self.vm_storage(vm) == SHARED_STORAGE]
+        return [
+            {
+                "id": f"storage/{node}/{LOCAL_STORAGE}", "type": "storage", "storage": LOCAL_STORAGE,
+                "node": node, "status": "available", "shared": 0,
+                "disk": used(local), "maxdisk": 8 * 1024 * GiB,
+            },
+            {
+                "id": f"storage/{node}/{SHARED_STORAGE}", "type": "storage", "storage": SHARED_STORAGE,
+                "node": node, "status": "available", "shared": 1,
+                "disk": used(shared), "maxdisk": 64 * 1024 * GiB,
+            },
+        ]
+
+    def next_vmid(self) -> int:
+        vmid = 100
+        while vmid in self.vms:
+            vmid += 1
+        return vmid
+
+    def start_task(self, node: str, task_type: str, vmid=None) -> str:
+        now = time.time()
+        pid = next(self._pids)
+        upid = f"UPID:{node}:{pid:08X}:{pid * 7:08X}:{int(now):08X}:{task_type}:{vmid or ''}:root@pam:"
+        self.tasks[upid] = {
+            "upid": upid,
+            "node": node,
+            "type": task_type,
+            "id": str(vmid or ""),
+            "user": "root@pam",
+            "pid": pid,
+            "starttime": int(now),
+            "_done_at": now + self.config.task_seconds,
+            "_fails": self.random.random() < self.config.task_failure_rate,
+        }
+        return upid
+
+    def task_view(self, task):
+        view = {k: v for k, v in task.items() if not k.startswith("_")}
+        if time.time() >= task["_done_at"]:
+            view["endtime"] = int(task["_done_at"])
+            view["status"] = "simulated failure" if task["_fails"] else "OK"
+        return view
+
+
+def _data(value):
+    return {"data": value}
+
+
+def build_app(cluster: FakeCluster) -> FastAPI:
+    config = cluster.config
+
+    async def simulate(request: Request):
+        cluster.api_calls += 1
+        if not request.headers.get("authorization", "").startswith("PVEAPIToken="):
+            raise HTTPException(status_code=401, detail="authentication failure")
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.failure_rate and random.random() < config.failure_rate:
+            raise HTTPException(status_code=500, detail="simulated failure")
+
+    async def params(request: Request):
+        if request.method in ("POST", "PUT"):
+            return dict(await request.form())
+        return dict(request.query_params)
+
+    # Handlers are all async so they run one at a time on the event loop and
+    # never see the cluster state half-changed
+    api = APIRouter(prefix="/api2/json", dependencies=[Depends(simulate)])
+
+    @api.get("/version")
+    async def version():
+        return _data({"version": "8.2.2", "release": "8.2", "repoid": "fake"})
+
+    @api.get("/cluster/status")
+    async def cluster_status():
+        entries = [{"type": "cluster", "id": "cluster", "name": "fake", "nodes": len(cluster.nodes), "quorate": 1}]
+        for i, node in enumerate(cluster.nodes):
+            entries.append({
+                "type": "node", "id": f"node/{node}", "name": node, "nodeid": i + 1,
+                "ip": "127.0.0.1", "online": 1, "local": 1 if i == 0 else 0,
+            })
+        return _data(entries)
+
+    @api.get("/cluster/resources")
+    async def cluster_resources(type: str = None):
+        result = []
+        if type in (None, "node"):
+            result += [cluster.node_info(node) for node in cluster.nodes]
+        if type in (None, "storage"):
+            result += [storage for node in cluster.nodes for storage in cluster.storage_info(node)]
+        if type in (None, "vm"):
+            result += [cluster.resource(vm) for vm in cluster.vms.values()]
+        return _data(result)
+
+    @api.get("/cluster/nextid")
+    async def nextid():
+        return _data(str(cluster.next_vmid()))
+
+    @api.get("/nodes")
+    async def nodes():
+        return _data([cluster.node_info(node) for node in cluster.nodes])
+
+    @api.get("/nodes/{node}/status")
+    async def node_status(node: str):
+        info = cluster.node_info(node)
+        return _data({
+            "cpu": info["cpu"], "uptime": info["uptime"],
+            "cpuinfo": {"cpus": info["maxcpu"]},
+            "memory": {"used": info["mem"], "total": info["maxmem"], "free": info["maxmem"] - info["mem"]},
+        })
+
+    @api.get("/nodes/{node}/qemu")
+    async def node_vms(node: str):
+        return _data([cluster.resource(vm) for vm in cluster.vms.values() if vm["node"] == node])
+
+    @api.get("/nodes/{node}/qemu/{vmid}/status/current")
+    async def vm_status(node: str, vmid: int):
+        return _data(cluster.resource(cluster.get_vm(node, vmid)))
+
+    @api.get("/nodes/{node}/qemu/{vmid}/config")
+    async def vm_config(node: str, vmid: int):
+        return _data(dict(cluster.get_vm(node, vmid)["config"]))
+
+    @api.put("/nodes/{node}/qemu/{vmid}/config")
+    async def update_vm_config(node: str, vmid: int, values: dict = Depends(params)):
+        cluster.get_vm(node, vmid)["config"].update(values)
+        return _data(None)
+
+    @api.post("/nodes/{node}/qemu/{vmid}/agent/{command}")
+    async def agent(node: str, vmid: int, command: str):
+        vm = cluster.get_vm(node, vmid)
+        if config.agent_latency_ms:
+            await asyncio.sleep(config.agent_latency_ms / 1000)
+        no_agent = (vmid * 2654435761 % 1000) / 1000 < config.agent_missing_rate
+        if vm["status"] != "running" or no_agent:
+            raise HTTPException(status_code=500, detail="QEMU guest agent is not running")
+        address = f"10.{vmid // 65536 % 256}.{vmid // 256 % 256}.{vmid % 256}"
+        return _data({"result": [
+            {"name": "lo", "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": "127.0.0.1"}]},
+            {"name": "eth0", "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": address}]},
+        ]})
+
+    @api.post("/nodes/{node}/qemu/{vmid}/clone")
+    async def clone(node: str, vmid: int, values: dict = Depends(params)):
+        source = cluster.get_vm(node, vmid)
+        newid = int(values["newid"])
+        if newid in cluster.vms:
+            raise HTTPException(status_code=500, detail=f"VM {newid} already exists")
+        target = values.get("target") or node
+        storage = cluster.vm_storage(source)
+        if target != node and storage != SHARED_STORAGE:
+            raise HTTPException(status_code=500, detail=f"can't clone VM to node '{target}' (VM uses local storage)")
+        cluster._add_vm(
+            newid, target, values.get("name") or f"clone-{newid}", ostype=source["config"]["ostype"], storage=storage
+        )
+        return _data(cluster.start_task(node, "qmclone", vmid))
+
+    @api.post("/nodes/{node}/qemu/{vmid}/status/{action}")
+    async def power(node: str, vmid: int, action: str):
+        vm = cluster.get_vm(node, vmid)
+        if action not in ("start", "stop", "shutdown", "reset"):
+            raise HTTPException(status_code=501, detail=f"Method 'POST /status/{action}' not implemented")
+        if action == "start" and vm["status"] != "running":
+            vm["status"], vm["started"] = "running", time.time()
+        elif action in ("stop", "shutdown"):
+            vm["status"], vm["started"] = "stopped", None
+        return _data(cluster.start_task(node, f"qm{action}", vmid))
+
+    @api.post("/nodes/{node}/startall")
+    async def startall(node: str, values: dict = Depends(params)):
+        vmids = [int(v) for v in values.get("vms", "").split(",") if v]
+        for vmid in vmids:
+            vm = cluster.vms.get(vmid)
+            if vm is not None and vm["node"] == node and vm["status"] != "running":
+                vm["status"], vm["started"] = "running", time.time()
+        return _data(cluster.start_task(node, "startall"))
+
+    @api.delete("/nodes/{node}/qemu/{vmid}")
+    async def delete_vm(node: str, vmid: int):
+        cluster.get_vm(node, vmid)
+        del cluster.vms[vmid]
+        return _data(cluster.start_task(node, "qmdestroy", vmid))
+
+    @api.get("/nodes/{node}/tasks")
+    async def node_tasks(node: str, limit: int = 50, since: int = 0):
+        tasks = [t for t in cluster.tasks.values() if t["node"] == node and t["starttime"] >= since]
+        tasks.sort(key=lambda t: t["starttime"], reverse=True)
+        return _data([cluster.task_view(t) for t in tasks[:limit]])
+
+    @api.get("/nodes/{node}/tasks/{upid}/status")
+    async def task_status(node: str, upid: str):
+        task = cluster.tasks.get(upid)
+        if task is None:
+            raise HTTPException(status_code=500, detail="no such task")
+        view = cluster.task_view(task)
+        view["exitstatus"] = view.pop("status", None)
+        view["status"] = "stopped" if "endtime" in view else "running"
+        return _data(view)
+
+    @api.post("/nodes/{node}/qemu/{vmid}/vncproxy")
+    async def vncproxy(node: str, vmid: int):
+        cluster.get_vm(node, vmid)
+        port = 5900 + next(cluster._ports) % 100
+        ticket = f"PVEVNC:{secrets.token_hex(8)}::{secrets.token_urlsafe(32)}"
+        cluster.tickets[ticket] = (node, vmid, str(port))
+        return _data({
+            "port": str(port),
+            "ticket": ticket,
+            "password": secrets.token_urlsafe(6),
+            "cert": "-----BEGIN CERTIFICATE-----\nfake\n-----END CERTIFICATE-----\n",
+            "user": "root@pam",
+            "upid": cluster.start_task(node, "vncproxy", vmid),
+        })
+
+    app = FastAPI(title="Fake PVE")
+    app.include_router(api)
+
+    @app.exception_handler(HTTPException)
+    async def pve_error(request, exc: HTTPException):
+        # pveproxy puts the message in the status line and returns no data
+        return JSONResponse({"data": None, "message": exc.detail}, status_code=exc.status_code)
+
+    @app.websocket("/api2/json/nodes/{node}/qemu/{vmid}/vncwebsocket")
+    async def vncwebsocket(websocket: WebSocket, node: str, vmid: int, port: str, vncticket: str):
+        if cluster.tickets.pop(vncticket, None) != (node, vmid, port):
+            await websocket.close(code=1008)
+            return
+        await websocket.accept(subprotocol="binary")
+        payload = os.urandom(config.vnc_frame_size) if config.vnc_frame_size else b""
+
+        async def stream():
+            await websocket.send_bytes(b"RFB 003.008\n")
+            while payload:
+                await websocket.send_bytes(payload)
+                # send may not yield while the socket buffer has room
+                await asyncio.sleep(0)
+
+        sender = asyncio.create_task(stream())
+        try:
+            # Discard client input until it goes away
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    return app
+
+
+def write_self_signed_cert(directory: str):
+    """
+    Write a self-signed localhost certificate and key, like a fresh PVE node's.
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "fake-pve.pem")
+    key_path = os.path.join(directory, "fake-pve.key")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def serve_in_thread(config: uvicorn.Config):
+    """
+    Run a uvicorn server on a daemon thread. Returns (server, thread, port)
+    once it is listening; port=0 in the config picks a free port.
+    """
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on {config.host}:{config.port} failed to start")
+        time.sleep(0.01)
+    return server, thread, server.servers[0].sockets[0].getsockname()[1]
+
+
+class FakePVEServer:
+    """
+    The simulator on a background thread, for use inside another program.
+    """
+
+    def __init__(self, config: FakePVEConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.cluster = FakeCluster(config or FakePVEConfig())
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+        self._tmpdir = None
+
+    def start(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        cert_path, key_path = write_self_signed_cert(self._tmpdir.name)
+        config = uvicorn.Config(
+            build_app(self.cluster), host=self.host, port=self.port, log_level="warning",
+            ssl_certfile=cert_path, ssl_keyfile=key_path,
+        )
+        self._server, self._thread, self.port = serve_in_thread(config)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    defaults = FakePVEConfig()
+    parser.add_argument("--nodes", type=int, default=defaults.nodes)
+    parser.add_argument("--vms", type=int, default=defaults.vms)
+    parser.add_argument("--templates", type=int, default=defaults.templates)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--failure-rate", type=float, default=defaults.failure_rate)
+    parser.add_argument("--agent-latency-ms", type=float, default=defaults.agent_latency_ms)
+    parser.add_argument("--agent-missing-rate", type=float, default=defaults.agent_missing_rate)
+    parser.add_argument("--task-seconds", type=float, default=defaults.task_seconds)
+    parser.add_argument("--task-failure-rate", type=float, default=defaults.task_failure_rate)
+    parser.add_argument("--vnc-frame-size", type=int, default=defaults.vnc_frame_size)
+
+
+def config_from_args(args) -> FakePVEConfig:
+    return FakePVEConfig(
+        nodes=args.nodes,
+        vms=args.vms,
+        templates=args.templates,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        agent_latency_ms=args.agent_latency_ms,
+        agent_missing_rate=args.agent_missing_rate,
+        task_seconds=args.task_seconds,
+        task_failure_rate=args.task_failure_rate,
+        vnc_frame_size=args.vnc_frame_size,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Proxmox VE API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8006)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakePVEServer(config_from_args(args), host=args.host, port=args.port).start()
+    print(f"Fake PVE with {args.nodes} nodes and {args.vms} VMs on https://{args.host}:{server.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
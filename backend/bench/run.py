@@ -0,0 +1,286 @@
+"""
+Load benchmarks of the backend against the simulated PVE (bench.fake_pve).
+
+    python -m bench.run --vms 2000 --users 200 --requests 200 --concurrency 20
+
+Starts the fake PVE and the API (uvicorn, as in production) in this process
+on free ports with a throwaway SQLite database, seeds users owning VMs, then
+runs each scenario and reports latency percentiles and throughput, plus the
+SQL statements per request (from /metrics) and the PVE API calls per request
+(counted by the fake PVE; includes background inventory and task polling).
+Client, API and fake PVE share one process, so compare runs with each other
+rather than with production numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from bench.fake_pve import FakePVEServer, add_config_arguments, config_from_args, serve_in_thread
+
+SCENARIOS = ["vms-admin", "vms-user", "dashboard", "users", "bulk", "vnc"]
+API = "/api/v1"
+
+
+def configure_backend(pve_port: int, db_path: str, args):
+    """
+    Point the backend settings at the fake PVE. Must run before app modules
+    are imported, since settings are read at import time.
+    """
+    os.environ.update({
+        "PVE_HOST": "127.0.0.1",
+        "PVE_PORT": str(pve_port),
+        "PVE_USER": "bench@pve",
+        "PVE_TOKEN_NAME": "bench",
+        "PVE_TOKEN_VALUE": "bench",
+        "PVE_VERIFY_SSL": "false",
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or "bench",
+        "INVENTORY_POLL_INTERVAL": str(args.poll_interval),
+        "METRICS_ENABLED": "true",
+        # Benchmarks log in many users; the login throttle is not under test
+        "LOGIN_MAX_CONCURRENT_PER_IP": "1000",
+        "LOGIN_MAX_FAILURES_PER_IP": "100000",
+    })
+
+
+async def seed(cluster, users: int, vms_per_user: int):
+    """
+    Create admin/admin and users user<N>/user owning consecutive desktops.
+    Returns {username: [(node, vmid), ...]}.
+    """
+    from app.core import database, migrations, security
+    from app.models.user import User
+    from app.models.vm import VM
+
+    await migrations.upgrade()
+    desktops = sorted(vmid for vmid, vm in cluster.vms.items() if not vm["template"])
+    admin_hash = security.get_password_hash("admin")
+    user_hash = security.get_password_hash("user")
+    owned = {}
+    async with database.SessionLocal() as db:
+        db.add(User(username="admin", hashed_password=admin_hash, is_superuser=True))
+        for i in range(users):
+            vmids = desktops[i * vms_per_user:(i + 1) * vms_per_user]
+            user = User(username=f"user{i}", hashed_password=user_hash)
+            user.vms = [VM(vmid=vmid, node=cluster.vms[vmid]["node"], name=cluster.vms[vmid]["name"]) for vmid in vmids]
+            db.add(user)
+            owned[user.username] = [(cluster.vms[vmid]["node"], vmid) for vmid in vmids]
+        await db.commit()
+    await database.engine.dispose()
+    return owned
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def scrape(client) -> dict:
+    """
+    Sum of the _count samples per histogram on /metrics.
+    """
+    counts = {}
+    text = (await client.get("/metrics")).text
+    for line in text.splitlines():
+        if line.startswith("#") or "_count" not in line:
+            continue
+        name, value = line.rsplit(" ", 1)
+        name = name.split("{", 1)[0].removesuffix("_count")
+        counts[name] = counts.get(name, 0) + float(value)
+    return counts
+
+
+async def run_requests(client, cluster, make_request, total: int, concurrency: int):
+    """
+    Issue `total` requests from `concurrency` workers. Returns a result dict.
+    """
+    latencies, errors = [], 0
+    indexes = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in indexes:
+            start = time.perf_counter()
+            try:
+                response = await make_request(i)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    before = await scrape(client)
+    pve_calls = cluster.api_calls
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    after = await scrape(client)
+    pve_calls = cluster.api_calls - pve_calls
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0) * 1000, 1),
+        "sql_per_request": round((after.get("db_query_duration_seconds", 0)
+                                  - before.get("db_query_duration_seconds", 0)) / max(total, 1), 1),
+        "pve_per_request": round(pve_calls / max(total, 1), 1),
+    }
+
+
+async def login(client, username: str, password: str) -> dict:
+    response = await client.post(f"{API}/auth/login/access-token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def vnc_session(client, api_port: int, headers: dict, node: str, vmid: int, seconds: float):
+    """
+    Open a console through /vnc-connect and read it for `seconds`.
+    Returns (seconds to the first byte, bytes received).
+    """
+    from websockets.asyncio.client import connect
+
+    started = time.perf_counter()
+    response = await client.post(f"{API}/vms/{vmid}/vnc-connect", headers=headers)
+    response.raise_for_status()
+    url = f"ws://127.0.0.1:{api_port}{API}/vms/ws/vncproxy/{node}/{vmid}?connect={response.json()['connect']}"
+    received, first_byte = 0, None
+    async with connect(url, max_size=None) as ws:
+        deadline = time.perf_counter() + seconds
+        while (remaining := deadline - time.perf_counter()) > 0:
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            received += len(message)
+    return first_byte, received
+
+
+async def run_vnc(client, api_port: int, sessions, seconds: float):
+    results = await asyncio.gather(
+        *(vnc_session(client, api_port, headers, node, vmid, seconds) for headers, node, vmid in sessions),
+        return_exceptions=True,
+    )
+    ok = [r for r in results if not isinstance(r, Exception) and r[0] is not None]
+    connects = [first_byte for first_byte, _ in ok]
+    total_bytes = sum(received for _, received in ok)
+    return {
+        "sessions": len(sessions),
+        "errors": len(sessions) - len(ok),
+        "connect_p50_ms": round(percentile(connects, 0.50) * 1000, 1),
+        "connect_p95_ms": round(percentile(connects, 0.95) * 1000, 1),
+        "total_mb_per_sec": round(total_bytes / seconds / 1e6, 1),
+        "per_session_mb_per_sec": round(total_bytes / seconds / 1e6 / max(len(ok), 1), 1),
+    }
+
+
+async def run_benchmarks(args, cluster, api_port: int, owned: dict) -> dict:
+    import httpx
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{api_port}", limits=limits, timeout=120) as client:
+        admin = await login(client, "admin", "admin")
+        usernames = [name for name, vms in owned.items() if vms][:max(args.concurrency, args.vnc_sessions)]
+        users = [(await login(client, name, "user"), owned[name]) for name in usernames]
+
+        # Let the inventory poller load the cluster before timing anything
+        await client.get(f"{API}/vms/dashboard", headers=admin)
+
+        for scenario in args.scenarios:
+            if scenario == "vms-admin":
+                result = await run_requests(
+                    client, cluster, lambda i: client.get(f"{API}/vms/", headers=admin), args.requests, args.concurrency
+                )
+            elif scenario == "vms-user":
+                result = await run_requests(
+                    client, cluster, lambda i: client.get(f"{API}/vms/", headers=users[i % len(users)][0]),
+                    args.requests, args.concurrency,
+                )
+            elif scenario == "dashboard":
+                result = await run_requests(
+                    client, cluster, lambda i: client.get(f"{API}/vms/dashboard", headers=admin), args.requests, args.concurrency
+                )
+            elif scenario == "users":
+                result = await run_requests(
+                    client, cluster, lambda i: client.get(f"{API}/users/", headers=admin), args.requests, args.concurrency
+                )
+            elif scenario == "bulk":
+                vmids = [vmid for vms in owned.values() for _, vmid in vms]
+                batches = [vmids[i:i + args.bulk_size] for i in range(0, len(vmids), args.bulk_size)]
+                actions = ["start", "stop"]
+
+                def bulk_request(i):
+                    body = {"action": actions[i // len(batches) % 2], "vmids": batches[i % len(batches)]}
+                    return client.post(f"{API}/vms/bulk-action", headers=admin, json=body)
+
+                result = await run_requests(client, cluster, bulk_request, args.bulk_requests, min(args.concurrency, len(batches)))
+            elif scenario == "vnc":
+                sessions = [(headers, *vms[0]) for headers, vms in users[:args.vnc_sessions]]
+                result = await run_vnc(client, api_port, sessions, args.vnc_seconds)
+            else:
+                raise SystemExit(f"Unknown scenario: {scenario}")
+            results[scenario] = result
+            print(f"{scenario:<10} " + "  ".join(f"{k}={v}" for k, v in result.items()), flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend load benchmarks against the simulated PVE")
+    add_config_arguments(parser)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--vms-per-user", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--bulk-requests", type=int, default=20)
+    parser.add_argument("--bulk-size", type=int, default=50, help="VMs per bulk action")
+    parser.add_argument("--vnc-sessions", type=int, default=10)
+    parser.add_argument("--vnc-seconds", type=float, default=5)
+    parser.add_argument("--poll-interval", type=int, default=30, help="INVENTORY_POLL_INTERVAL for the API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from {SCENARIOS}")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+
+    fake_pve = FakePVEServer(config_from_args(args)).start()
+    tmpdir = tempfile.TemporaryDirectory()
+    configure_backend(fake_pve.port, os.path.join(tmpdir.name, "bench.db"), args)
+
+    import uvicorn
+    from app.core.ws_protocol import VNCWebSocketProtocol
+    from app.main import app
+
+    api_server = None
+    try:
+        owned = asyncio.run(seed(fake_pve.cluster, args.users, args.vms_per_user))
+        config = uvicorn.Config(app, host="127.0.0.1", port=0, ws=VNCWebSocketProtocol, log_level="warning")
+        api_server, api_thread, api_port = serve_in_thread(config)
+        print(
+            f"Fake PVE: {args.nodes} nodes, {args.vms} VMs, {args.latency_ms} ms latency; "
+            f"{args.users} users x {args.vms_per_user} VMs; concurrency {args.concurrency}",
+            flush=True,
+        )
+        results = asyncio.run(run_benchmarks(args, fake_pve.cluster, api_port, owned))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"args": vars(args), "results": results}, f, indent=2)
+    finally:
+        if api_server is not None:
+            api_server.should_exit = True
+            api_thread.join(timeout=30)
+        fake_pve.stop()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
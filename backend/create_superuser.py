@@ -1,13 +1,12 @@
-from sqlalchemy.orm import Session
-from app.core.database import SessionLocal, engine, Base
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import database, migrations
 from app.models.user import User
 from app.core.security import get_password_hash
 
-# Ensure tables exist
-Base.metadata.create_all(bind=engine)
-
-def init_db(db: Session):
-    user = db.query(User).filter(User.username == "admin").first()
+async def init_db(db: AsyncSession):
+    user = (await db.scalars(select(User).where(User.username == "admin"))).first()
     if not user:
         user = User(
             username="admin",
@@ -15,11 +14,17 @@ def init_db(db: Session):
             is_superuser=True,
         )
         db.add(user)
-        db.commit()
+        await db.commit()
         print("Superuser created")
     else:
         print("Superuser already exists")
 
+async def main():
+    # Ensure tables exist and are up to date
+    await migrations.upgrade()
+    async with database.SessionLocal() as db:
+        await init_db(db)
+    await database.engine.dispose()
+
 if __name__ == "__main__":
-    db = SessionLocal()
-    init_db(db)
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Regression test: the number of SQL statements behind /vms/ and /users/ must
+not grow with the number of users and VMs (no N+1 queries).
+
+The app runs in-process on a throwaway SQLite database; the PVE inventory is
+a pre-populated cluster_state snapshot, so no PVE is needed.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.TemporaryDirectory()
+# Settings are read at import time
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(_tmpdir.name, 'test.db')}",
+    "SECRET_KEY": "test",
+    "INVENTORY_POLL_INTERVAL": "3600",
+    "PVE_CLUSTERS": "[]",
+    "PVE_CLUSTER_NAME": "default",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import event
+from app.core import database, migrations, security
+from app.main import app
+from app.models.user import User
+from app.models.vm import VM
+from app.services.cache import principal_cache
+from app.services.inventory import cluster_state
+
+API = "/api/v1"
+NODES = ["pve1", "pve2"]
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+counter = StatementCounter(database.engine.sync_engine)
+
+
+async def seed(users: int, vms_per_user: int, first_vmid: int):
+    """
+    Add `users` users owning `vms_per_user` VMs each, and list the VMs in the
+    inventory snapshot.
+    """
+    async with database.SessionLocal() as db:
+        vmid = first_vmid
+        for i in range(users):
+            user = User(username=f"user-{first_vmid}-{i}", hashed_password="x")
+            user.vms = []
+            for _ in range(vms_per_user):
+                user.vms.append(VM(vmid=vmid, node=NODES[vmid % len(NODES)], name=f"desktop-{vmid}"))
+                vmid += 1
+            db.add(user)
+        await db.commit()
+        vms = (await db.execute(VM.__table__.select())).all()
+    snapshot = [
+        {"cluster": "default", "vmid": vm.vmid, "node": vm.node, "name": vm.name, "status": "running",
+         "template": 0, "cpu": 0.1, "mem": 1, "maxmem": 2, "ostype": "l26", "ip": None}
+        for vm in vms
+    ]
+    nodes = [{"cluster": "default", "node": node, "status": "online"} for node in NODES]
+    cluster_state.clusters = {
+        "default": {"nodes": nodes, "vms": snapshot, "updated_at": time.time(), "error": None, "stale_since": None}
+    }
+    cluster_state.nodes, cluster_state.vms = nodes, snapshot
+    cluster_state.updated_at = time.time()
+
+
+async def statements(client, path: str, token: str) -> int:
+    # Authentication is counted too: start from an empty principal cache
+    principal_cache.clear()
+    before = counter.count
+    response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    return counter.count - before
+
+
+async def measure(client, user_token: str) -> dict:
+    admin_token = security.create_access_token({"sub": "admin"})
+    return {
+        "vms-admin": await statements(client, f"{API}/vms/", admin_token),
+        "vms-user": await statements(client, f"{API}/vms/", user_token),
+        "users": await statements(client, f"{API}/users/", admin_token),
+    }
+
+
+async def run():
+    await migrations.upgrade()
+    async with database.SessionLocal() as db:
+        db.add(User(username="admin", hashed_password="x", is_superuser=True, vms=[]))
+        await db.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await seed(users=3, vms_per_user=2, first_vmid=100)
+        small = await measure(client, security.create_access_token({"sub": "user-100-0"}))
+        # Ten times the users, and users owning many more VMs
+        await seed(users=30, vms_per_user=8, first_vmid=1000)
+        large = await measure(client, security.create_access_token({"sub": "user-1000-0"}))
+    await database.engine.dispose()
+    return small, large
+
+
+def test_statement_count_does_not_grow_with_users_and_vms():
+    small, large = asyncio.run(run())
+    assert all(count > 0 for count in small.values())
+    assert large == small